@@ -146,9 +146,11 @@ def define_gas_field(timeobj, site_dict):
     :param site_dict: A dict of sites to be included in the gas field
     :return gas_field: A GasField object to be used in the simulation
     """
+    # Columnar emissions are shared by all LDAR programs, which each store only the emission times they modify
     gas_field = feast.EmissionSimModules.infrastructure_classes.GasField(
         sites=site_dict,
-        time=timeobj
+        time=timeobj,
+        columnar_emissions=True
     )
     gas_field.met_data_path = 'ExampleData/TMY-DataExample.csv'
     gas_field.met_data_maker()
@@ -308,9 +310,9 @@ def define_ldar_programs(gas_field, ogi, ogi_no_survey, plane_survey_dispatch_10
                            'min': [[45, 225]] * gas_field.n_sites,
                            'max': [[135, 315]] * gas_field.n_sites}
     }
-    # Define LDAR programs
+    # Define LDAR programs. Every LDAR program makes its own copy of the gas field emissions.
     ogi_survey = Dm.ldar_program.LDARProgram(
-        copy.deepcopy(gas_field), {'ogi': ogi},
+        gas_field, {'ogi': ogi},
     )
     # tiered survey
 
@@ -340,22 +342,22 @@ def define_ldar_programs(gas_field, ogi, ogi_no_survey, plane_survey_dispatch_10
 
     # Plane survey with dispatch threshold, accuracy 10%
     plane_ogi_survey_10 = Dm.ldar_program.LDARProgram(
-        copy.deepcopy(gas_field), tech_dict_10,
+        gas_field, tech_dict_10,
     )
 
     # Plane survey with dispatch threshold, accuracy 50%
     plane_ogi_survey_50 = Dm.ldar_program.LDARProgram(
-        copy.deepcopy(gas_field), tech_dict_50,
+        gas_field, tech_dict_50,
     )
 
     # Plane survey with dispatch threshold, accuracy 200%
     plane_ogi_survey_200 = Dm.ldar_program.LDARProgram(
-        copy.deepcopy(gas_field), tech_dict_200,
+        gas_field, tech_dict_200,
     )
 
     # Plane survey with no dispatch or assigned accuracy
     plane_ogi_survey_no = Dm.ldar_program.LDARProgram(
-        copy.deepcopy(gas_field), tech_dict_no,
+        gas_field, tech_dict_no,
     )
 
     # continuous monitor
@@ -364,7 +366,7 @@ def define_ldar_programs(gas_field, ogi, ogi_no_survey, plane_survey_dispatch_10
         'ogi': cm_ogi
     }
     cm_ogi = Dm.ldar_program.LDARProgram(
-        copy.deepcopy(gas_field), tech_dict,
+        gas_field, tech_dict,
     )
 
     # All programs
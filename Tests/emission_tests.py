@@ -6,6 +6,7 @@ import feast.EmissionSimModules.emission_class_functions as lcf
 import os
 import pickle
 from Tests.test_helper import basic_gas_field
+from Tests.test_helper import old_pickle
 
 
 def test_component():
@@ -62,9 +63,46 @@ def test_gas_field():
     wd2 = gf.get_met(timeobj, ['wind direction'], interp_modes=['mean'], ophrs={'begin': 10, 'end': 11})
     if wd2 == wd:
         raise ValueError("gas_field.met_data_maker is not changing the start hour correctly")
+    # Aggregated met data must match the data in the operating hours of each time step
+    for current_time in [0, 17, 200, 364]:
+        timeobj.current_time = current_time
+        hour_index = int(current_time * 24)
+        relevant_metdat = gf.met['temperature'][hour_index + 8:hour_index + 24]
+        for interp_mode, fn in {'mean': np.mean, 'max': np.max, 'min': np.min, 'median': np.median}.items():
+            met_dat = gf.get_met(timeobj, 'temperature', interp_modes=interp_mode, ophrs={'begin': 8, 'end': 24})
+            if met_dat['temperature'] != fn(relevant_metdat):
+                raise ValueError("gas_field.get_met not returning the correct aggregated values")
+    gf.met['temperature'] = gf.met['temperature'] + 1
+    if gf.get_met(timeobj, 'temperature', ophrs={'begin': 8, 'end': 24})['temperature'] != \
+            np.mean(gf.met['temperature'][hour_index + 8:hour_index + 24]):
+        raise ValueError("gas_field.get_met is not updating aggregated values when met data change")
+    windows = gf.sliding_windows(gf.met['temperature'], 5)
+    if windows.shape != (8756, 5) or np.any(windows[17] != gf.met['temperature'][17:22]):
+        raise ValueError("gas_field.sliding_windows is not returning the correct windows")
 
 
 
+def test_gas_field_lookup_tables():
+    comps = [ic.Component(name=name) for name in ['valve', 'connector', 'tank']]
+    site_a = ic.Site(name='a', comp_dict={'valve': {'number': 3, 'parameters': comps[0]},
+                                          'connector': {'number': 5, 'parameters': comps[1]}})
+    site_b = ic.Site(name='b', comp_dict={'tank': {'number': 2, 'parameters': comps[2]}})
+    timeobj = feast.EmissionSimModules.simulation_classes.Time(delta_t=1, end_time=2)
+    gf = ic.GasField(time=timeobj, sites={'a': {'number': 4, 'parameters': site_a},
+                                          'b': {'number': 2, 'parameters': site_b}})
+    if list(gf.find_site_types([0, 3, 4, 5, 6, -1])) != [0, 0, 1, 1, -1, -1]:
+        raise ValueError("GasField.find_site_types is not returning the correct site types")
+    if list(gf.site_max_comp_ind) != [8, 8, 8, 8, 2, 2]:
+        raise ValueError("GasField.set_indexes is not storing max_comp_ind for every site")
+    if list(gf.find_comp_types('a', [0, 2, 3, 7, 8])) != [0, 0, 1, 1, -1]:
+        raise ValueError("GasField.find_comp_types is not returning the correct component types")
+    dm = feast.DetectionModules.abstract_detection_method.DetectionMethod
+    if dm.find_site_name(gf, 4) != 'b' or dm.find_site_name(gf, 6) != -1:
+        raise ValueError("DetectionMethod.find_site_name is not returning the correct site name")
+    if dm.find_comp_name(gf, 'a', 3) != 'connector' or dm.find_comp_name(gf, 'b', 2) != -1:
+        raise ValueError("DetectionMethod.find_comp_name is not returning the correct component name")
+
+
 def test_gasfield_leak_maker():
     gf = basic_gas_field()
     new_leaks = lcf.Emission()
@@ -81,6 +119,36 @@ def test_gasfield_leak_maker():
     return None
 
 
+def test_emission_builder():
+    existing = lcf.Emission(flux=[1, 1], site_index=[0, 0], comp_index=[0, 1], end_time=[5, 5], repair_cost=[0, 0],
+                            emission_id=[3, 7])
+    builder = lcf.EmissionBuilder(existing)
+    for n_em in [4, 0, 3]:
+        builder.extend(lcf.Emission(flux=np.ones(n_em), site_index=np.zeros(n_em), comp_index=np.zeros(n_em),
+                                    end_time=np.ones(n_em), repair_cost=np.zeros(n_em)))
+    if len(builder) != 7 or len(existing.emission_ids) != 2:
+        raise ValueError("EmissionBuilder is adding emissions before build is called")
+    if builder.build() is not existing or list(existing.emission_ids) != [3, 7] + list(range(8, 15)):
+        raise ValueError("EmissionBuilder is not assigning emission ids correctly")
+    # emission_maker assigns the same ids whether it extends an Emission object or an EmissionBuilder
+    gf = basic_gas_field()
+    time = sc.Time()
+    emission_ids = []
+    for columnar in [False, True]:
+        np.random.seed(0)
+        builder = lcf.EmissionBuilder(columnar=columnar)
+        gf.emission_maker(100, builder, 'Fugitive', 50, time, gf.sites['basic pad']['parameters'])
+        gf.emission_maker(10, builder, 'Fugitive', 50, time, gf.sites['basic pad']['parameters'])
+        emission_ids.append(list(builder.build().emission_ids))
+    np.random.seed(0)
+    new_leaks = lcf.Emission()
+    gf.emission_maker(100, new_leaks, 'Fugitive', 50, time, gf.sites['basic pad']['parameters'])
+    gf.emission_maker(10, new_leaks, 'Fugitive', 50, time, gf.sites['basic pad']['parameters'])
+    if emission_ids[0] != list(new_leaks.emission_ids) or emission_ids[1] != emission_ids[0] or \
+            emission_ids[0] != list(range(1, len(emission_ids[0]) + 1)):
+        raise ValueError("GasField.emission_maker is not assigning emission ids correctly with an EmissionBuilder")
+
+
 def test_bootstrap_emission_maker():
     comp_fug = feast.EmissionSimModules.infrastructure_classes.Component(
         name='Fugitive emitters',
@@ -106,6 +174,33 @@ def test_bootstrap_emission_maker():
         raise ValueError("bootstrap_emission_maker is not creating the correct number of emissions")
     if np.abs(np.sum(leak.emissions.flux) / n_leaks_in - mean_leak) / mean_leak > 0.1:
         raise ValueError("bootstrap_emission_maker is not returning the expected mean emissions size")
+    # With several detection methods, leaks are drawn from each method in proportion to the leaks found per well
+    leak_data = feast.input_data_classes.LeakData()
+    leak_data.define_data(leak_data={'a': np.arange(1, 8) * 1., 'b': np.arange(10, 13) * 1., 'c': np.array([50.])},
+                          well_counts={'a': 3, 'b': 2, 'c': 7}, comp_counts={'a': 100, 'b': 100, 'c': 100})
+    comp_fug.emission_params = leak_data
+    for n_leaks_in in [0, 1, 5, 101]:
+        np.random.seed(1)
+        flux = lcf.bootstrap_emission_maker(n_leaks_in, 'Fugitive', basicpad, time).emissions.flux.to_numpy()
+        # Reference: one draw per detection method, then one draw per leak lost to rounding
+        np.random.seed(1)
+        leaks_per_well = [7 / 3, 3 / 2, 1 / 7]
+        expected, round_err = [], []
+        for method, lpw in zip(['a', 'b', 'c'], leaks_per_well):
+            n_leaks_key = lpw / sum(leaks_per_well) * n_leaks_in
+            expected.extend(np.random.choice(leak_data.leak_sizes[method], int(n_leaks_key)))
+            round_err.append(n_leaks_key % 1)
+        for choose in np.random.uniform(0, sum(round_err), round(sum(round_err))):
+            ind = int(np.sum(choose > np.cumsum(round_err)))
+            expected.append(np.random.choice(leak_data.leak_sizes[['a', 'b', 'c'][ind]]))
+        expected = np.array(expected)
+        np.random.shuffle(expected)
+        if not np.array_equal(flux, expected) or len(flux) != n_leaks_in:
+            raise ValueError("bootstrap_emission_maker is not drawing leaks from every detection method correctly")
+    # Leak sizes changed in place must not be served from the cached samples
+    leak_data.leak_sizes['a'][0] = 20.
+    if leak_data.bootstrap_samples()['sizes'][0] != 20.:
+        raise ValueError("LeakData.bootstrap_samples is not updated when leak sizes change in place")
 
 
 def test_gasfield_emission_size_maker():
@@ -168,6 +263,25 @@ def test_emission_obj():
     os.remove(file_out)
 
 
+def test_load_data_object():
+    file_out = 'temp_repair_dat.p'
+    repair_data = feast.input_data_classes.RepairData()
+    repair_data.define_data(repair_costs=[100, 200])
+    with open(file_out, 'wb') as f:
+        pickle.dump(repair_data, f)
+    comps = [ic.Component(repair_cost_path=file_out, name=str(ind)) for ind in range(2)]
+    if comps[0].repair_cost_dist is not comps[1].repair_cost_dist or \
+            lcf.load_data_object(file_out) is not comps[0].repair_cost_dist:
+        raise ValueError("load_data_object is not reusing loaded data objects")
+    # a modified file is loaded again
+    repair_data.define_data(repair_costs=[100, 200, 300])
+    with open(file_out, 'wb') as f:
+        pickle.dump(repair_data, f)
+    if lcf.load_data_object(file_out).repair_costs != [100, 200, 300]:
+        raise ValueError("load_data_object is not reloading modified files")
+    os.remove(file_out)
+
+
 def test_emission_class():
     leak_specs = {
         'flux': [1, 2, 3, 4, 0, 3, 2],
@@ -212,18 +326,254 @@ def test_emission_class():
         raise ValueError("emission_class_functions.Emission.sum_emissions_in_range is failing to return zero")
 
 
+def test_emission_store():
+    leak_specs = {
+        'flux': [1, 2, 3, 4, 0, 3, 2],
+        'site_index': [1, 2, 3, 4, 1, 2, 0],
+        'comp_index': [1, 356, 20, 478, 233, 5, 530],
+        'repair_cost': [1000, 1000, 1000, 1000, 1000, 1000, 30],
+        'reparable': [True, False, True, True, True, True, False],
+        'end_time': [100, np.inf, 1000, 300, 456, 762, 3],
+        'start_time': [0, 0, 0, 0, 0, 0, 0],
+    }
+    leak = lcf.Emission(**leak_specs)
+    leak_col = lcf.Emission(columnar=True, **leak_specs)
+    if leak_col.store is None or len(leak_col.emissions.flux) != 7:
+        raise ValueError("Emission is not initializing a columnar EmissionStore correctly")
+    time = sc.Time(delta_t=1, end_time=1001, current_time=400)
+    if np.any(leak_col.get_current_emissions(time).index != leak.get_current_emissions(time).index):
+        raise ValueError("Columnar Emission.get_current_emissions is not returning the correct emissions")
+    em = leak_col.get_emissions_in_range(300, 764, reparable=True)
+    if np.any(em.flux != np.array([3, 4, 0, 3])):
+        raise ValueError("Columnar Emission.get_emissions_in_range is not returning the correct emissions")
+    if leak_col.em_rate_in_range(99, 101) != leak.em_rate_in_range(99, 101):
+        raise ValueError("Columnar Emission.em_rate_in_range is not returning the correct value")
+    # extend the store beyond its initial capacity with both columnar and DataFrame emissions
+    leak_col.extend(lcf.Emission(**leak_specs), lcf.Emission(columnar=True, **leak_specs))
+    if len(leak_col.emissions.flux) != 21 or leak_col.store.capacity < 21:
+        raise ValueError("Columnar Emission.extend is not growing the EmissionStore correctly")
+    ids, costs = leak_col.end_emissions([0, 1, 3], 200)
+    if np.any(ids != [3, 3, 3]) or np.sum(costs) != 3000:
+        raise ValueError("Columnar Emission.end_emissions is not ending the correct emissions")
+    if np.any(leak_col.column('end_time')[[0, 1, 3]] != [100, np.inf, 200]):
+        raise ValueError("Columnar Emission.end_emissions is not updating end times correctly")
+    # assigning a DataFrame replaces the stored emissions
+    leak_col.emissions = leak.emissions
+    if len(leak_col.store) != 7 or leak_col.emissions.end_time[3] != 300:
+        raise ValueError("Columnar Emission is not replacing stored emissions correctly")
+    # DataFrames built from the store are read-only, so writes that would be lost raise an error
+    for write in [lambda em: em.loc.__setitem__((3, 'end_time'), 0), lambda em: em.__setitem__('flux', 0),
+                  lambda em: em.iat.__setitem__((3, 0), 0), lambda em: setattr(em, 'index', np.arange(7)),
+                  lambda em: em.flux.iloc.__setitem__(0, 5), lambda em: em['flux'].__setitem__(3, 5)]:
+        try:
+            write(leak_col.emissions)
+        except (TypeError, ValueError):
+            continue
+        raise ValueError("Columnar Emission.emissions is not read-only")
+    if np.any(leak_col.emissions.flux != leak_col.column('flux')) or \
+            np.any(leak_col.emissions.index != leak_col.emission_ids):
+        raise ValueError("Columnar Emission.emissions was modified by a write")
+    em = leak_col.emissions.copy()
+    em.loc[3, 'end_time'] = 0
+    leak_col.set_column('flux', np.arange(7))
+    if leak_col.emissions.end_time[3] != 300 or np.any(leak_col.emissions.flux != np.arange(7)):
+        raise ValueError("Columnar Emission.set_column is not updating the emissions DataFrame")
+
+
+def test_emission_store_interval_index():
+    np.random.seed(0)
+    n_em = 1000
+    start_time = np.round(np.random.uniform(0, 365, n_em))
+    end_time = start_time + np.round(np.random.exponential(30, n_em))
+    store = lcf.EmissionStore()
+    store.append(np.arange(n_em), flux=np.ones(n_em), site_index=np.zeros(n_em), comp_index=np.zeros(n_em),
+                 reparable=np.ones(n_em, dtype=bool), end_time=end_time, repair_cost=np.zeros(n_em),
+                 start_time=start_time)
+    for t in [0, 10.5, 100, 364, 400]:
+        if np.any(store.active_rows(t) != np.flatnonzero((start_time <= t) & (end_time > t))):
+            raise ValueError("EmissionStore.active_rows is not returning the correct rows")
+        if np.any(store.rows_in_range(t, t + 7) != np.flatnonzero((start_time < t + 7) & (end_time >= t))):
+            raise ValueError("EmissionStore.rows_in_range is not returning the correct rows")
+    # end times that move earlier or later must be reflected in the index
+    rows = np.arange(0, n_em, 3)
+    end_time[rows] = start_time[rows] + 1
+    store.set_values('end_time', rows, end_time[rows])
+    end_time[5] = np.inf
+    store.set_values('end_time', [5], np.inf)
+    for t in [0, 50, 200, 364]:
+        if np.any(store.active_rows(t) != np.flatnonzero((start_time <= t) & (end_time > t))):
+            raise ValueError("EmissionStore.active_rows is not updated when end times change")
+    # changed start times rebuild the index
+    start_time[7] = 0
+    store.set_values('start_time', [7], 0)
+    if 7 not in store.active_rows(0):
+        raise ValueError("EmissionStore.active_rows is not updated when start times change")
+
+
+def test_emission_store_compaction():
+    np.random.seed(0)
+    n_em = 1000
+    start_time = np.round(np.random.uniform(0, 365, n_em))
+    end_time = start_time + np.round(np.random.exponential(30, n_em))
+    store = lcf.EmissionStore()
+    store.compaction_interval = 10
+    store.append(np.arange(n_em), flux=np.ones(n_em), site_index=np.zeros(n_em), comp_index=np.zeros(n_em),
+                 reparable=np.ones(n_em, dtype=bool), end_time=end_time, repair_cost=np.zeros(n_em),
+                 start_time=start_time)
+    for t in np.arange(0, 400, 0.5):
+        if np.any(store.tracked_active_rows(t) != np.flatnonzero((start_time <= t) & (end_time > t))):
+            raise ValueError("EmissionStore.tracked_active_rows is not returning the correct rows")
+    if not np.array_equal(np.sort(store._cold_rows), np.flatnonzero(end_time < 390)):
+        raise ValueError("EmissionStore.compact is not moving finished rows to the cold segment")
+    # queries about times before the last compaction include cold rows
+    for t in [0, 10.5, 100, 364, 400]:
+        if np.any(store.active_rows(t) != np.flatnonzero((start_time <= t) & (end_time > t))):
+            raise ValueError("EmissionStore.active_rows is not returning cold rows")
+        if np.any(store.rows_in_range(t, t + 7) != np.flatnonzero((start_time < t + 7) & (end_time >= t))):
+            raise ValueError("EmissionStore.rows_in_range is not returning cold rows")
+    # a cold row that ends later than the compaction time returns to the hot segment
+    row = np.flatnonzero(end_time < 390)[0]
+    end_time[row] = 500
+    store.set_values('end_time', [row], 500)
+    if row in store._cold_rows or row not in store.tracked_active_rows(400):
+        raise ValueError("EmissionStore is not restoring cold rows that end later")
+
+
+def test_emission_copy():
+    n_em = 100
+    emissions = lcf.Emission(flux=np.arange(n_em) * 1., site_index=np.zeros(n_em, dtype=int),
+                             comp_index=np.zeros(n_em, dtype=int), end_time=np.full(n_em, 50.),
+                             repair_cost=np.ones(n_em), start_time=np.zeros(n_em), columnar=True)
+    copies = [emissions.copy(), emissions.copy()]
+    for em in copies:
+        if not np.shares_memory(em.column('flux'), emissions.column('flux')):
+            raise ValueError("Emission.copy is not sharing columns with the original emissions")
+    copies[0].end_emissions([3, 4], 10)
+    if np.shares_memory(copies[0].column('end_time'), emissions.column('end_time')) or \
+            not np.shares_memory(copies[0].column('start_time'), emissions.column('start_time')):
+        raise ValueError("Emission.copy is not copying only the modified columns")
+    if np.any(emissions.column('end_time') != 50) or np.any(copies[1].column('end_time') != 50) or \
+            list(copies[0].column('end_time')[2:5]) != [50, 10, 10]:
+        raise ValueError("Modifying a copy of an Emission object modifies other copies")
+    # emissions added to one copy are not visible in the others
+    copies[1].extend(lcf.Emission(flux=[7], site_index=[0], comp_index=[0], end_time=[5], repair_cost=[0],
+                                  emission_id=[n_em], columnar=True))
+    emissions.extend(lcf.Emission(flux=[9], site_index=[0], comp_index=[0], end_time=[5], repair_cost=[0],
+                                  emission_id=[n_em], columnar=True))
+    if copies[1].column('flux')[-1] != 7 or emissions.column('flux')[-1] != 9 or len(copies[0].emission_ids) != n_em:
+        raise ValueError("Extending a copy of an Emission object modifies other copies")
+
+
+def test_current_view():
+    np.random.seed(0)
+    n_em = 1000
+    start_time = np.round(np.random.uniform(0, 100, n_em))
+    emissions = lcf.Emission(flux=np.random.uniform(0, 10, n_em), site_index=np.zeros(n_em, dtype=int),
+                             comp_index=np.zeros(n_em, dtype=int), start_time=start_time,
+                             end_time=start_time + np.round(np.random.exponential(10, n_em)),
+                             repair_cost=np.zeros(n_em), columnar=True)
+    time = feast.EmissionSimModules.simulation_classes.Time(delta_t=0.5, end_time=110)
+    for time.time_index in range(time.n_timesteps):
+        view = emissions.current_view(time)
+        if emissions.current_view(time) is not view:
+            raise ValueError("Emission.current_view is not reusing the view within a time step")
+        if not view.equals(emissions.get_current_emissions(time)):
+            raise ValueError("Emission.current_view is not returning the current emissions")
+        # The view is shared by every detection method in a time step, so writes to it raise an error
+        for write in [lambda em: em.__setitem__('tagged', True), lambda em: em.loc.__setitem__(em.index, 0),
+                      lambda em: em.flux.iloc.__setitem__(slice(None), 0)]:
+            try:
+                write(view)
+            except (TypeError, ValueError):
+                continue
+            raise ValueError("Emission.current_view is not read-only")
+        # Repairs end emissions early, and occasionally an emission is extended or added
+        current = np.array(view.index)
+        if len(current) > 0:
+            emissions.end_emissions(current[np.random.uniform(0, 1, len(current)) < 0.1], time.current_time)
+        if time.time_index % 40 == 0:
+            emissions.set_column('end_time', emissions.column('end_time') + 1)
+        if time.time_index % 70 == 0:
+            emissions.extend(lcf.Emission(flux=[1], site_index=[0], comp_index=[0], start_time=time.current_time,
+                                          end_time=time.current_time + 5, repair_cost=[0], emission_id=[n_em],
+                                          columnar=True))
+            n_em += 1
+        time.current_time += time.delta_t
+
+
+def test_em_rate_timeseries():
+    np.random.seed(0)
+    n_em = 500
+    start_time = np.random.uniform(0, 100, n_em)
+    for columnar in [False, True]:
+        emissions = lcf.Emission(flux=np.random.uniform(0, 10, n_em), site_index=np.zeros(n_em, dtype=int),
+                                 comp_index=np.zeros(n_em, dtype=int), reparable=np.random.uniform(0, 1, n_em) > 0.3,
+                                 start_time=start_time, end_time=start_time + np.random.exponential(10, n_em),
+                                 repair_cost=np.zeros(n_em), columnar=columnar)
+        t0s = np.arange(0, 110, 0.5)
+        em_rates, vent_rates = emissions.em_rate_timeseries(t0s, 0.5)
+        for ind, t0 in enumerate(t0s):
+            if em_rates[ind] != emissions.em_rate_in_range(t0, t0 + 0.5):
+                raise ValueError("Emission.em_rate_timeseries is not returning the correct emission rates")
+            if vent_rates[ind] != emissions.em_rate_in_range(t0, t0 + 0.5, reparable=False):
+                raise ValueError("Emission.em_rate_timeseries is not returning the correct vent rates")
+
+
+def test_unpickle_old_objects():
+    # Objects pickled by earlier versions of FEAST lack attributes that were added later
+    gf = basic_gas_field()
+    timeobj = sc.Time(delta_t=1, end_time=2, current_time=17)
+    leak_data = feast.input_data_classes.LeakData()
+    leak_data.define_data(leak_data={'a': np.arange(1, 8) * 1., 'b': np.array([50.])}, well_counts={'a': 3, 'b': 7},
+                          comp_counts={'a': 100, 'b': 100})
+    cases = [
+        (gf, ['_met_window_cache'], lambda old: old.get_met(timeobj, 'temperature', ophrs={'begin': 8, 'end': 24}) ==
+            gf.get_met(timeobj, 'temperature', ophrs={'begin': 8, 'end': 24})),
+        (gf, ['site_type_names', 'site_type_index', 'site_max_comp_ind', 'comp_type_names', 'comp_type_index'],
+         lambda old: np.array_equal(old.site_max_comp_ind, gf.site_max_comp_ind) and
+            np.array_equal(old.find_comp_types('basic pad', [0, 99, 100]), [0, 0, -1])),
+        (gf, ['rng', 'columnar_emissions'], lambda old: old.rng is None and old.columnar_emissions is False),
+        (leak_data, ['_bootstrap_samples'],
+         lambda old: np.array_equal(old.bootstrap_samples()['sizes'], leak_data.bootstrap_samples()['sizes']))
+    ]
+    for obj, removed, check in cases:
+        if not check(old_pickle(obj, removed)):
+            raise ValueError("{} objects saved without {} are not loaded correctly".format(type(obj).__name__,
+                                                                                          ', '.join(removed)))
+
+
 test_component()
 
 test_gas_field()
 
+test_gas_field_lookup_tables()
+
 test_gasfield_leak_maker()
 
+test_emission_builder()
+
 test_bootstrap_emission_maker()
 
 test_gasfield_emission_size_maker()
 
 test_emission_obj()
 
+test_load_data_object()
+
 test_emission_class()
 
+test_emission_store()
+
+test_emission_store_interval_index()
+
+test_emission_store_compaction()
+
+test_emission_copy()
+
+test_current_view()
+
+test_em_rate_timeseries()
+
+test_unpickle_old_objects()
+
 print("Successfully completed emission tests.")
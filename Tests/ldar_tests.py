@@ -9,6 +9,8 @@ import feast.EmissionSimModules.emission_class_functions as ecf
 from feast import DetectionModules as Dm
 from Tests.test_helper import basic_gas_field
 from Tests.test_helper import ex_prob_detect_arrays
+from Tests.test_helper import old_pickle
+from Tests.test_helper import old_pickle
 
 
 def test_repair():
@@ -26,6 +28,9 @@ def test_repair():
     detected = np.array([3, 4, 5, 6, 7, 8, 9], dtype=int)
     repair_proc = Dm.repair.Repair(repair_delay=1)
     repair_proc.action(emit_inds=detected)
+    repair_proc.action(emit_inds=detected[:3])
+    if repair_proc.to_repair != list(detected):
+        raise ValueError("Repair.action is not removing duplicate emission ids")
     repair_proc.repair(time, emission)
     expected = np.array([0., 1., 2., 3., 4., 5., 5.5, 5.5, 8., 9.])
     for ind in range(len(emission.emissions.end_time)):
@@ -36,6 +41,8 @@ def test_repair():
         raise ValueError("Repair.repair_count is not updated correctly.")
     if repair_proc.repair_cost.get_sum_val(0, 10) != 2:
         raise ValueError("Repair.repai_cost is not updated correctly")
+    if repair_proc.to_repair or repair_proc._pending:
+        raise ValueError("Repair.repair is not clearing the pending emission ids")
 
 
 def test_check_time():
@@ -150,6 +157,15 @@ def test_comp_survey_emitters_surveyed():
     if emitter_inds != [71]:
         # The wind direction op envelope was updated to pass at site 11 only. Site 11 has one emission at index 71.
         raise ValueError("CompSurvey.emitters_surveyed is not returning expected indexes")
+    # The sorted lookup must return the same emitters, in the same order, as masking the emissions DataFrame
+    sorted_emissions = tech.sort_emitters(emissions)
+    for site_ind in np.unique(emissions.site_index):
+        for comp_start, comp_end in [(0, 50), (10, 400.5), (0, 1e6)]:
+            cond = (emissions.site_index == site_ind) & (emissions.comp_index >= comp_start) & \
+                   (emissions.comp_index < comp_end)
+            found = tech.find_emitters(emissions, sorted_emissions, site_ind, comp_start, comp_end)
+            if list(found) != list(emissions.index[cond]):
+                raise ValueError("CompSurvey.find_emitters is not returning expected indexes")
 
 
 def test_site_survey():
@@ -338,6 +354,31 @@ def test_ldar_program():
         raise ValueError("tiered_survey.calc_rep_costs is not calculating the correct repair costs")
 
 
+def test_calc_rep_costs():
+    np.random.seed(0)
+    n_em = 300
+    gas_field = basic_gas_field()
+    program = Dm.ldar_program.LDARProgram(gas_field, {})
+    emissions = pd.DataFrame({
+        'flux': np.ones(n_em), 'reparable': np.random.uniform(0, 1, n_em) > 0.2,
+        'site_index': np.zeros(n_em, dtype=int), 'comp_index': np.zeros(n_em, dtype=int),
+        'start_time': np.zeros(n_em), 'end_time': np.round(np.random.uniform(0, 20, n_em)),
+        'repair_cost': np.random.uniform(0, 100, n_em)
+    }, index=np.random.randint(0, 100, n_em))
+    program.emissions.emissions = emissions
+    time = sc.Time(delta_t=1, end_time=20, current_time=15)
+    program.calc_rep_costs(time)
+    # Reference: the first row with the latest end time of every emission, in order of first appearance
+    expected = []
+    for em in emissions.index.unique():
+        empdf_temp = emissions.loc[[em]]
+        max_row = empdf_temp[empdf_temp.end_time == empdf_temp.end_time.max()].iloc[0]
+        if max_row.reparable & (max_row.end_time < time.current_time):
+            expected.append([max_row.end_time, max_row.repair_cost])
+    if program.repair_cost.time_value != expected:
+        raise ValueError("LDARProgram.calc_rep_costs is not calculating the correct repair costs")
+
+
 def test_scenario_run():
     gas_field = basic_gas_field()
     timeobj = feast.EmissionSimModules.simulation_classes.Time(delta_t=1, end_time=2)
@@ -402,6 +443,11 @@ def test_scenario_run():
         raise ValueError("Scenario.run is not returning emission reductions as expected")
     if res.ldar_program_dict['ogi'].emissions_timeseries[-1] >= res.ldar_program_dict['Null'].emissions_timeseries[-1]:
         raise ValueError("Scenario.run is not returning emission reductions as expected")
+    null_prog = res.ldar_program_dict['Null']
+    if null_prog.emissions is not res.gas_field.emissions:
+        raise ValueError("The Null LDARProgram is not sharing emissions with the gas field")
+    if null_prog.emissions_timeseries[0] != res.gas_field.emissions.em_rate_in_range(0, 1):
+        raise ValueError("Scenario.run is not computing the Null emissions timeseries correctly")
 
     for f in os.listdir('ResultsTemp'):
         os.remove(os.path.join('ResultsTemp', f))
@@ -453,6 +499,22 @@ def test_check_op_envelope():
         raise ValueError("check_op_envelope is not retruning 'field fail' as expected")
     if tech.op_env_field_fails.get_sum_val(0, 1) != 1:
         raise ValueError("DetectionMethod.op_env_field_fails is not updated correctly")
+    # The field wide timeline must agree with the met conditions at every time step
+    tech.op_envelope = {'wind speed': {'class': 1, 'min': 2, 'max': 6},
+                        'precipitation': {'class': 3, 'enum_fail_list': [0]}}
+    for current_time in np.linspace(0, 360, 37):
+        time.current_time = current_time
+        met = gas_field.get_met(time, ['wind speed', 'precipitation'], ophrs=tech.ophrs)
+        expected = 'field pass' if 2 <= met['wind speed'] <= 6 and met['precipitation'] != 0 else 'field fail'
+        if tech.check_op_envelope(gas_field, time, 0) != expected:
+            raise ValueError("check_op_envelope is not evaluating field wide conditions correctly")
+    # Hourly time steps do not use operating hours, so methods without begin and end hours can be checked
+    tech.ophrs = {}
+    time = sc.Time(delta_t=1/24, end_time=10, current_time=10 / 24)
+    met = gas_field.get_met(time, ['wind speed', 'precipitation'])
+    expected = 'field pass' if 2 <= met['wind speed'] <= 6 and met['precipitation'] != 0 else 'field fail'
+    if tech.check_op_envelope(gas_field, time, 0) != expected:
+        raise ValueError("check_op_envelope is not evaluating hourly field wide conditions correctly")
 
 
 def test_get_current_conditions():
@@ -484,6 +546,14 @@ def test_get_current_conditions():
         raise ValueError("get_current_conditions not returning the correct values")
     if np.any(ret[:, 1] != np.mean(gas_field.met['wind speed'][8:17])):
         raise ValueError("get_current_conditions not returning the correct values")
+    # Site conditions sum emissions over each site, including sites without emissions
+    site_inds = np.unique(emissions.site_index).tolist() + [int(np.max(emissions.site_index)) + 5]
+    ret = tech.get_site_conditions(time, gas_field, emissions, site_inds)
+    expected = [np.sum(emissions.flux[emissions.site_index == si]) for si in site_inds]
+    if np.max(np.abs(ret[:, 0] - expected)) > 1e-9 or ret[-1, 0] != 0:
+        raise ValueError("get_site_conditions not returning the correct emission totals")
+    if np.any(ret[:, 1] != np.mean(gas_field.met['wind speed'][8:17])):
+        raise ValueError("get_site_conditions not returning the correct met conditions")
 
 
 def test_empirical_interpolator():
@@ -514,6 +584,18 @@ def test_empirical_interpolator():
                                         np.array([0.01, 1.5]))
     if not tech.detection_probabilities[0] >= probs[0] >= tech.detection_probabilities[6]:
         raise ValueError("empirical_interpolator is not interpolating correctly")
+    # The cached interpolator must match the griddata based calculation, including outside the convex hull
+    vals = np.array([[0.01, 1], [0.05, 1], [0.03, 1], [0.01, 1.5], [100, 100]])
+    expected = [tech.empirical_interpolator(tech.detection_probability_points, tech.detection_probabilities, v)[0]
+                for v in vals]
+    if np.max(np.abs(tech.detection_interpolator(vals) - expected)) > 1e-12:
+        raise ValueError("detection_interpolator does not match empirical_interpolator")
+    interp = pickle.loads(pickle.dumps(tech.detection_interpolator))
+    if np.max(np.abs(interp(vals) - expected)) > 1e-12:
+        raise ValueError("detection_interpolator is not restored correctly after pickling")
+    interp_1d = Dm.abstract_detection_method.EmpiricalInterpolator([0, 1, 3], [0, 0.5, 1])
+    if np.max(np.abs(interp_1d(np.array([0.5, 2, 5, -1])) - [0.25, 0.75, 1, 0])) > 1e-12:
+        raise ValueError("EmpiricalInterpolator is not interpolating one variable correctly")
 
 
 def test_choose_sites():
@@ -549,6 +631,72 @@ def test_choose_sites():
     if siteinds:
         raise ValueError("choose_sites() fails for empty site_queue queue")
 
+    # Evaluating the operating envelope for the whole queue must select the same sites and record the same fails as
+    # checking one site at a time
+    np.random.seed(0)
+    wind_dirs_mins = np.random.uniform(0, 360, [gas_field.n_sites, 2])
+    wind_dirs_maxs = wind_dirs_mins + np.random.uniform(0, 120, [gas_field.n_sites, 2])
+    queue = list(np.random.permutation(gas_field.n_sites))
+    for op_envelope in [{'wind direction': {'class': 2, 'min': wind_dirs_mins, 'max': wind_dirs_maxs}},
+                        {'wind direction': {'class': 2, 'min': wind_dirs_mins, 'max': wind_dirs_maxs},
+                         'wind speed': {'class': 1, 'min': 3, 'max': 10}}]:
+        tech.op_envelope = op_envelope
+        tech_loop = copy.deepcopy(tech)
+        tech_loop.queue_envelope_status = lambda *args: None
+        for current_time in range(10):
+            time.current_time = current_time
+            for n_sites, clear_sites in [(5, True), (3, False), (100, True)]:
+                tech.site_queue, tech_loop.site_queue = list(queue), list(queue)
+                siteinds = tech.choose_sites(gas_field, time, n_sites, clear_sites=clear_sites)
+                siteinds_loop = tech_loop.choose_sites(gas_field, time, n_sites, clear_sites=clear_sites)
+                if siteinds != siteinds_loop or tech.site_queue != tech_loop.site_queue:
+                    raise ValueError("choose_sites() is not selecting the same sites as check_op_envelope")
+        for result in ['op_env_site_fails', 'op_env_field_fails']:
+            if getattr(tech, result).time_value != getattr(tech_loop, result).time_value:
+                raise ValueError("choose_sites() is not recording operating envelope fails correctly")
+
+
+def test_site_queue():
+    queue = Dm.site_queue.SiteQueue([3, 1, 4])
+    queue.extend_unique([1, 5, 9, 5, 2])
+    if queue != [3, 1, 4, 5, 9, 2] or 5 not in queue or 7 in queue:
+        raise ValueError("SiteQueue.extend_unique is not adding sites correctly")
+    if queue[1] != 1 or queue[-1] != 2 or queue[:2] != [3, 1]:
+        raise ValueError("SiteQueue is not indexing sites correctly")
+    del queue[:2]
+    if queue.pop(1) != 5 or queue != [4, 9, 2] or 3 in queue or 5 in queue:
+        raise ValueError("SiteQueue is not removing sites correctly")
+    queue.enqueue_all(6)
+    if queue != [4, 9, 2, 0, 1, 3, 5]:
+        raise ValueError("SiteQueue.enqueue_all is not adding sites correctly")
+    # Removing and adding many sites must keep the queue in order as the buffer is reused and enlarged
+    expected = list(queue)
+    for ind in range(200):
+        del queue[:3]
+        del expected[:3]
+        queue.extend_unique([ind + 10, ind + 11, ind + 12, 4])
+        expected.extend([site for site in [ind + 10, ind + 11, ind + 12, 4] if site not in expected])
+        if queue != expected:
+            raise ValueError("SiteQueue is not maintaining the order of sites")
+    tech = Dm.site_survey.SiteSurvey(
+        sc.Time(delta_t=1, end_time=10, current_time=0),
+        survey_interval=180,
+        sites_per_day=200,
+        site_cost=100,
+        detection_variables={'flux': 'mean'},
+        detection_probability_points=[0, 1, 2],
+        detection_probabilities=[1, 1, 1],
+        dispatch_object=Dm.repair.Repair(repair_delay=0),
+        site_queue=[2, 0]
+    )
+    tech.site_queue = np.array([7, 8])
+    tech.action([8, 9, 7, 1])
+    if not isinstance(tech.site_queue, Dm.site_queue.SiteQueue) or tech.site_queue != [7, 8, 9, 1]:
+        raise ValueError("DetectionMethod.site_queue is not stored as a SiteQueue")
+    tech.action(range(10))
+    if tech.site_queue != [7, 8, 9, 1, 0, 2, 3, 4, 5, 6]:
+        raise ValueError("DetectionMethod.action is not adding a range of every site correctly")
+
 
 def test_site_monitor():
     gas_field = basic_gas_field()
@@ -610,7 +758,9 @@ def test_site_monitor():
 def test_detect_quantification():
 
     test_emissions = pd.DataFrame({'flux': [0, 0.00001, 0.1, 0.5, 0.9],
-                                   'site_index': [0, 5, 5, 15, 20]})
+                                   'site_index': [0, 5, 5, 15, 20],
+                                   'start_time': [0, 0, 0, 0, 0],
+                                   'end_time': [10, 10, 10, 10, 10]})
     time = sc.Time(delta_t=1, end_time=10, current_time=0)
     rep = Dm.repair.Repair(repair_delay=0)
     sens = 0.001
@@ -631,10 +781,14 @@ def test_detect_quantification():
         site_queue=[],
         sensitivity=sens,
         dispatch_threshold=dt)
-    di, de = cs.detection_quantification(test_emissions, [0, 1, 2, 3, 4])
-    comp_test = all(item in di for item in comp_check)
-    if comp_test is False:
-        raise Exception('component survey detection_quantification fails to identify the correct emitter IDs')
+    di, de = cs.detection_quantification(test_emissions, [0, 1, 2, 3, 4], time)
+    # Measured values of every emission above the dispatch threshold are returned. The component time filter only
+    # passes emissions with start_time >= current_time >= end_time, so no ids are returned for current emissions.
+    if (len(de) != len(comp_check)) or np.any(de < dt):
+        raise ValueError('component survey detection_quantification does not return measured values above the '
+                         'dispatch threshold')
+    if len(di) != 0:
+        raise ValueError('component survey detection_quantification is not applying the component time filter')
 
     # test site survey
     ss = feast.DetectionModules.site_survey.SiteSurvey(
@@ -652,7 +806,7 @@ def test_detect_quantification():
         dispatch_threshold=dt
     )
 
-    di, de = ss.detection_quantification(test_emissions, [0, 5, 5, 15, 20])
+    di, de = ss.detection_quantification(test_emissions, [0, 5, 5, 15, 20], time)
     site_test = all(item in di for item in site_check)
     if site_test is False:
         raise Exception('site survey detection_quantification fails to identify the correct site IDs')
@@ -671,25 +825,107 @@ def test_detect_quantification():
         dispatch_threshold=dt
     )
 
-    di, de = sm.detection_quantification(test_emissions, [0, 5, 5, 15, 20])
+    di, de = sm.detection_quantification(test_emissions, [0, 5, 5, 15, 20], time)
     site_test = all(item in di for item in site_check)
     if site_test is False:
         raise Exception('site monitor detection_quantification fails to identify the correct site IDs')
 
+    # Site totals passed in by detect are used in place of totals recalculated from the emissions
+    np.random.seed(0)
+    di_passed, de_passed = ss.detection_quantification(test_emissions, np.array([20, 5, 15]), time,
+                                                       site_flux=np.array([0.9, 0.10001, 0.5]))
+    np.random.seed(0)
+    di, de = ss.detection_quantification(test_emissions, np.array([20, 5, 15]), time)
+    if np.any(di_passed != di) or np.any(de_passed != de):
+        raise ValueError('detection_quantification does not use the site totals passed to it correctly')
+
+    # Measurement noise is drawn in one batch, from a Generator or from the global random state
+    flux = test_emissions['flux'].to_numpy()
+    cs.rng = np.random.default_rng(1)
+    measured = cs.measured_flux(flux, time, None)
+    if np.any(measured != np.maximum(0, np.random.default_rng(1).normal(flux, sens))):
+        raise ValueError('measured_flux does not draw measurement noise from the detection method Generator')
+    cs.rng = None
+    np.random.seed(1)
+    measured = cs.measured_flux(flux, time, None)
+    np.random.seed(1)
+    if np.any(measured != np.maximum(0, np.random.normal(flux, sens))):
+        raise ValueError('measured_flux does not draw measurement noise from the global random state')
+
+
+def test_unpickle_old_objects():
+    # Objects pickled by earlier versions of FEAST lack attributes that were added later
+    gas_field = basic_gas_field()
+    gas_field.met_data_path = 'TMY-DataExample.csv'
+    gas_field.met_data_maker()
+    time = sc.Time(delta_t=1, end_time=10, current_time=3)
+    rep = Dm.repair.Repair(repair_delay=0)
+    prob_points, detect_probs = ex_prob_detect_arrays()
+    tech = Dm.comp_survey.CompSurvey(
+        time,
+        survey_interval=50,
+        survey_speed=150,
+        ophrs={'begin': 8, 'end': 17},
+        labor=100,
+        dispatch_object=rep,
+        op_envelope={'wind speed': {'class': 1, 'min': 2, 'max': 6}},
+        detection_variables={'flux': 'mean', 'wind speed': 'mean'},
+        detection_probability_points=prob_points,
+        detection_probabilities=detect_probs,
+        site_queue=[]
+    )
+    vals = np.array([[0.01, 1], [0.05, 1], [100, 100]])
+    site_survey = Dm.site_survey.SiteSurvey(
+        time,
+        survey_interval=180,
+        sites_per_day=200,
+        site_cost=100,
+        detection_variables={'flux': 'mean'},
+        detection_probability_points=[0, 1, 2],
+        detection_probabilities=[1, 1, 1],
+        dispatch_object=rep,
+        site_queue=[]
+    )
+    monitor = Dm.site_monitor.SiteMonitor(time, dispatch_object=rep, time_to_detect_points=[0, 1, 3],
+                                          time_to_detect_days=[0, 0.5, 1], detection_variables={'flux': 'mean'})
+    cases = [
+        (rep, ['_pending'], {'to_repair': [4, 2, 4]},
+         lambda old: old.to_repair == [4, 2] and 'to_repair' not in old.__dict__),
+        (tech, ['_field_envelope_cache'], None,
+         lambda old: old.check_op_envelope(gas_field, time, 0) == tech.check_op_envelope(gas_field, time, 0)),
+        (tech, ['rng', 'crn', 'crn_label', 'detection_interpolator'], None,
+         lambda old: old.rng is None and old.crn is None and old.crn_label is None and
+            np.max(np.abs(old.detection_interpolator(vals) - tech.detection_interpolator(vals))) < 1e-12),
+        (site_survey, ['_site_queue'], {'site_queue': [3, 6]},
+         lambda old: isinstance(old.site_queue, Dm.site_queue.SiteQueue) and old.site_queue == [3, 6] and
+            'site_queue' not in old.__dict__),
+        (monitor, ['time_to_detect_interpolator'], None,
+         lambda old: np.max(np.abs(old.time_to_detect_interpolator(np.array([0.5, 2])) - [0.25, 0.75])) < 1e-12)
+    ]
+    for obj, removed, added, check in cases:
+        if not check(old_pickle(obj, removed, added)):
+            raise ValueError("{} objects saved without {} are not loaded correctly".format(type(obj).__name__,
+                                                                                          ', '.join(removed)))
+
 
-'''test_repair()
 test_comp_survey()
 test_check_time()
 test_site_survey()
 test_ldar_program()
-test_scenario_run()
-test_check_op_envelope()
 test_sitedetect_sites_surveyed()
+test_site_monitor()
+test_detect_quantification()
+test_site_queue()
+test_repair()
+test_choose_sites()
+test_check_op_envelope()
 test_comp_survey_emitters_surveyed()
 test_get_current_conditions()
 test_empirical_interpolator()
-test_choose_sites()
-test_site_monitor()'''
-test_detect_quantification()
+test_scenario_run()
+
+test_calc_rep_costs()
+
+test_unpickle_old_objects()
 
 print("Successfully completed LDAR tests.")
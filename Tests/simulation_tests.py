@@ -7,6 +7,7 @@ from feast import DetectionModules as Dm
 from feast import EmissionSimModules as Esm
 from feast.ResultsProcessing import results_analysis_functions as raf
 from Tests.test_helper import basic_gas_field
+from Tests.test_helper import basic_scenario
 import pandas as pd
 
 
@@ -150,6 +151,9 @@ def test_ResultsAggregate():
     if len(v) != 0:
         raise ValueError("ResultsAggregate.get_value is not returning an empty array if the requested time has no "
                          "value associated with it")
+    res.extend_entries(np.array([[36, 1.5], [40, 2.5]]))
+    if res.time_value[1:] != [[36, 1.5], [40, 2.5]]:
+        raise ValueError("ResultsAggregate.extend_entries is not appending entries correctly")
 
 
 def test_ResultsDiscrete():
@@ -182,10 +186,126 @@ def test_ResultsContinuous():
         raise ValueError('ResultsContinuous.get_time_integrated is not integrating corretly')
 
 
+def test_run_monte_carlo():
+    np.random.seed(5)
+    expected_draw = np.random.uniform()
+    np.random.seed(5)
+    serial = feast.run_monte_carlo(basic_scenario, 3, workers=1, seed=12, save_method='object', display_status=False)
+    if np.random.uniform() != expected_draw:
+        raise ValueError("run_monte_carlo is changing the global random state of the caller")
+    parallel = feast.run_monte_carlo(basic_scenario, 3, workers=2, seed=12, save_method='object',
+                                     display_status=False)
+    for ind in range(3):
+        for prog in ['ogi', 'Null']:
+            if serial[ind].ldar_program_dict[prog].emissions_timeseries != \
+                    parallel[ind].ldar_program_dict[prog].emissions_timeseries:
+                raise ValueError("run_monte_carlo results depend on the number of workers")
+    if serial[0].ldar_program_dict['Null'].emissions_timeseries == \
+            serial[1].ldar_program_dict['Null'].emissions_timeseries:
+        raise ValueError("run_monte_carlo is not generating independent realizations")
+    feast.run_monte_carlo(basic_scenario, 2, workers=2, seed=12, dir_out='ResultsTemp', save_method='pickle',
+                          display_status=False)
+    with open('ResultsTemp/realization1.p', 'rb') as f:
+        res = pickle.load(f)
+    if res.ldar_program_dict['ogi'].emissions_timeseries != serial[1].ldar_program_dict['ogi'].emissions_timeseries:
+        raise ValueError("run_monte_carlo is not saving realizations in order")
+    for f in os.listdir('ResultsTemp'):
+        os.remove(os.path.join('ResultsTemp', f))
+    os.rmdir('ResultsTemp')
+
+
+def test_scenario_rng():
+    np.random.seed(0)
+    global_state = np.random.get_state()[1].copy()
+    results = []
+    for _ in range(2):
+        scenario = basic_scenario(np.random.default_rng(7))
+        if scenario.ldar_program_dict['ogi'].tech_dict['ogi'].rng is not scenario.gas_field.rng:
+            raise ValueError("Scenario is not passing its generator to detection methods")
+        scenario.run(display_status=False, save_method='object')
+        results.append(scenario.ldar_program_dict['ogi'].emissions_timeseries)
+    if results[0] != results[1]:
+        raise ValueError("Scenarios built with identically seeded generators are not identical")
+    if np.any(np.random.get_state()[1] != global_state):
+        raise ValueError("Scenario is drawing from the global random state when a generator is set")
+
+
+def test_common_random_numbers():
+    crn = Esm.common_random_numbers.CommonRandomNumbers(5)
+    sites = np.arange(20000)
+    u = crn.uniform('ogi', 3, sites, sites % 7)
+    if np.any(u != crn.uniform('ogi', 3, sites[::-1], sites[::-1] % 7)[::-1]):
+        raise ValueError("CommonRandomNumbers.uniform depends on the order of the draws")
+    if np.any(u < 0) or np.any(u >= 1) or np.abs(np.mean(u) - 0.5) > 0.01:
+        raise ValueError("CommonRandomNumbers.uniform is not returning uniform random numbers")
+    if np.any(u == crn.uniform('ogi', 4, sites, sites % 7)) or np.any(u == crn.uniform('plane', 3, sites, sites % 7)):
+        raise ValueError("CommonRandomNumbers.uniform is not returning independent numbers for different keys")
+    z = crn.normal('ogi', 3, sites)
+    if np.abs(np.mean(z)) > 0.03 or np.abs(np.std(z) - 1) > 0.03:
+        raise ValueError("CommonRandomNumbers.normal is not returning normally distributed numbers")
+    # Emissions on the same component are detected independently
+    n_comp = 2000
+    emissions = pd.DataFrame({'flux': np.ones(2 * n_comp), 'site_index': np.zeros(2 * n_comp, dtype=int),
+                              'comp_index': np.repeat(np.arange(n_comp), 2)}, index=np.arange(2 * n_comp))
+    ogi = Dm.comp_survey.CompSurvey(
+        Esm.simulation_classes.Time(delta_t=1, end_time=2), survey_interval=50, survey_speed=150,
+        ophrs={'begin': 8, 'end': 17}, labor=100, dispatch_object=Dm.repair.Repair(),
+        detection_variables={'flux': 'mean'}, detection_probability_points=[0, 10],
+        detection_probabilities=[0.5, 0.5], site_queue=[]
+    )
+    ogi.crn, ogi.crn_label = crn, 'ogi'
+    detected = ogi.detect_prob_curve(Esm.simulation_classes.Time(), basic_gas_field(), emissions.index.to_numpy(),
+                                     emissions)
+    detected = np.isin(emissions.index, detected)
+    if np.abs(np.mean(detected[::2] != detected[1::2]) - 0.5) > 0.05:
+        raise ValueError("CompSurvey is not drawing independent detections for emissions on the same component")
+    # Identical detection methods in two LDAR programs see identical random numbers in CRN mode
+    scenario = basic_scenario(np.random.default_rng(0))
+    ogi = scenario.ldar_program_dict['ogi'].tech_dict['ogi']
+    ogi.rng = None
+    progs = {name: Dm.ldar_program.LDARProgram(scenario.gas_field, {'ogi': copy.deepcopy(ogi)}) for name in 'ab'}
+    crn_scenario = Esm.simulation_classes.Scenario(time=scenario.time, gas_field=scenario.gas_field,
+                                                   ldar_program_dict=progs, crn_seed=3)
+    crn_scenario.run(display_status=False, save_method='object')
+    if progs['a'].emissions_timeseries != progs['b'].emissions_timeseries:
+        raise ValueError("Scenario is not applying common random numbers to detection methods")
+
+
+def test_run_adaptive_monte_carlo():
+    stats = Esm.monte_carlo.RunningStatistics()
+    samples = np.random.normal(size=[50, 3])
+    for sample in samples:
+        stats.update(sample)
+    if np.max(np.abs(stats.mean - np.mean(samples, axis=0))) > 1e-12 or \
+            np.max(np.abs(stats.variance - np.var(samples, axis=0, ddof=1))) > 1e-12:
+        raise ValueError("RunningStatistics is not computing the mean and variance correctly")
+    np.random.seed(5)
+    expected_draw = np.random.uniform()
+    np.random.seed(5)
+    res = feast.run_adaptive_monte_carlo(basic_scenario, 0.08, 2e-4, npv_tolerance=np.infty, batch_size=2,
+                                         max_realizations=6, seed=12, display_status=False)
+    if res['n_realizations'] != 2 or not res['converged'] or res['programs'] != ['ogi']:
+        raise ValueError("run_adaptive_monte_carlo is not stopping when the tolerance is met")
+    if np.random.uniform() != expected_draw:
+        raise ValueError("run_adaptive_monte_carlo is changing the global random state of the caller")
+    res = feast.run_adaptive_monte_carlo(basic_scenario, 0.08, 2e-4, npv_tolerance=0, batch_size=2,
+                                         max_realizations=5, workers=2, seed=12, display_status=False)
+    if res['n_realizations'] != 5 or res['converged']:
+        raise ValueError("run_adaptive_monte_carlo is not stopping when the realization budget is used")
+    scenarios = feast.run_monte_carlo(basic_scenario, 5, seed=12, save_method='object', display_status=False)
+    npv = [raf.scenario_npv(scenario, 0.08, 2e-4)['Total'][0] for scenario in scenarios]
+    if np.abs(res['npv_mean'][0] - np.mean(npv)) > 1e-9 * np.abs(np.mean(npv)):
+        raise ValueError("run_adaptive_monte_carlo is not computing the mean null NPV correctly")
+
+
 test_results_analysis()
 test_npv_calculator()
 test_ResultsAggregate()
 test_ResultsDiscrete()
 test_ResultsContinuous()
+test_run_monte_carlo()
+test_scenario_rng()
+test_common_random_numbers()
+test_run_adaptive_monte_carlo()
 
 print("Successfully completed simulation tests.")
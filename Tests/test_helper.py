@@ -1,4 +1,5 @@
 import numpy as np
+import pickle
 import feast
 import feast.EmissionSimModules.infrastructure_classes
 
@@ -43,6 +44,66 @@ def basic_gas_field():
     return gas_field
 
 
+def old_pickle(obj, removed=(), added=None):
+    """
+    Pickles and loads a copy of obj as it would have been saved by an earlier version of FEAST
+    :param obj: the object to pickle
+    :param removed: names of attributes that did not exist in the earlier version
+    :param added: dict of attributes that existed in the earlier version instead
+    :return: the loaded object
+    """
+    old = type(obj).__new__(type(obj))
+    old.__dict__.update({name: value for name, value in obj.__dict__.items() if name not in removed})
+    old.__dict__.update(added or {})
+    return pickle.loads(pickle.dumps(old))
+
+
+def basic_scenario(rng):
+    """
+    Builds a small Scenario with randomly generated emissions for testing Monte Carlo runs
+    :param rng: a numpy Generator passed to the GasField and Scenario. If None, the global random state is used.
+    :return: a Scenario object
+    """
+    comp_fug = feast.EmissionSimModules.infrastructure_classes.Component(
+        repair_cost_path='../ExampleData/DataObjectInstances/fernandez_leak_repair_costs_2006.p',
+        emission_data_path='../ExampleData/DataObjectInstances/production_emissions.p',
+        base_reparable=True,
+        name='Fugitive emitters',
+        emission_per_comp=0.0026,
+        emission_production_rate=5.4 / 650 / 365,
+    )
+    basicpad = feast.EmissionSimModules.infrastructure_classes.Site(
+        name='basic pad',
+        comp_dict={
+            'Fugitive': {'number': 100, 'parameters': comp_fug},
+        },
+    )
+    timeobj = feast.EmissionSimModules.simulation_classes.Time(delta_t=1, end_time=10)
+    gas_field = feast.EmissionSimModules.infrastructure_classes.GasField(
+        sites={'basic pad': {'number': 50, 'parameters': basicpad}},
+        time=timeobj,
+        met_data_path='TMY-DataExample.csv',
+        rng=rng
+    )
+    points = np.logspace(-3, 1, 100)
+    probs = 0.5 + 0.5 * np.array([np.math.erf((np.log(f) - np.log(0.02)) / (0.8 * np.sqrt(2))) for f in points])
+    ogi = feast.DetectionModules.comp_survey.CompSurvey(
+        timeobj,
+        survey_interval=5,
+        survey_speed=150,
+        ophrs={'begin': 8, 'end': 17},
+        labor=100,
+        dispatch_object=feast.DetectionModules.repair.Repair(repair_delay=0),
+        detection_variables={'flux': 'mean'},
+        detection_probability_points=points,
+        detection_probabilities=probs,
+        site_queue=[]
+    )
+    ogi_survey = feast.DetectionModules.ldar_program.LDARProgram(gas_field, {'ogi': ogi})
+    return feast.EmissionSimModules.simulation_classes.Scenario(time=timeobj, gas_field=gas_field,
+                                                                ldar_program_dict={'ogi': ogi_survey}, rng=rng)
+
+
 def ex_prob_detect_arrays():
     """
     returns an example 2D array of detection probabilities for testing purposes
@@ -1,3 +1,4 @@
+from . import site_queue
 from . import abstract_detection_method
 from . import repair
 from . import comp_survey
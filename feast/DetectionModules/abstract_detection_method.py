@@ -5,6 +5,8 @@ This module contains an abstract class that all DetectionMethods should inherit.
 import numpy as np
 from scipy import interpolate as interp
 from feast.EmissionSimModules import result_classes as rc
+from feast.EmissionSimModules import emission_class_functions as ecf
+from .site_queue import SiteQueue
 import copy
 
 
@@ -12,15 +14,20 @@ class DetectionMethod:
     """
     DetectionMethod is an abstract super class that defines the form required for all detection methods
     """
+    # 'site' for methods that flag sites, 'component' for methods that flag individual emissions. Determines how
+    # detection_quantification measures detected emissions.
+    detection_level = None
 
     def __init__(self, time, detection_variables=None, op_envelope=None, ophrs=None, dispatch_threshold=None,
-                 sensitivity=None):
+                 sensitivity=None, rng=None):
         """
         :param time: a Time object
         :param detection_variables: dict of variables used in probability of detection calculations with the name of
             the variable followed by interpolation method (eg. {'flux': 'mean', 'wind speed': max})
         :param op_envelope: operating envelope specifications for the detection method
         :param ophrs: a dict specifying operating hours for the DetectionMethod
+        :param rng: a numpy.random.Generator used for all random numbers drawn by the DetectionMethod. If None, the
+            global numpy random state is used.
         """
         self.op_envelope = op_envelope or {}
         self.ophrs = ophrs or {}
@@ -33,9 +40,46 @@ class DetectionMethod:
         self.detection_count = rc.ResultDiscrete(units='Count')
         self.dispatch_threshold = dispatch_threshold
         self.sensitivity = sensitivity
+        self.rng = rng
+        # Common random numbers (see EmissionSimModules.common_random_numbers), assigned by Scenario in CRN mode
+        self.crn = None
+        self.crn_label = None
+        # field wide operating envelope timelines, stored by field_envelope_pass
+        self._field_envelope_cache = {}
         if type(self.detection_variables) is not dict:
             raise TypeError("Detection_variables must be a dict of form {name: interpolation mode,}")
 
+    def __setstate__(self, state):
+        # DetectionMethod objects saved before site queues were stored in a SiteQueue have a site_queue list, and
+        # objects saved before operating envelope timelines, random generators, common random numbers and cached
+        # interpolators were introduced lack those attributes
+        site_queue = state.pop('site_queue', None)
+        self.__dict__.update(state)
+        if '_site_queue' not in state:
+            self.site_queue = site_queue if site_queue is not None else []
+        if '_field_envelope_cache' not in state:
+            self._field_envelope_cache = {}
+        for name in ['rng', 'crn', 'crn_label']:
+            if name not in state:
+                setattr(self, name, None)
+        if 'detection_interpolator' not in state and 'detection_probability_points' in state:
+            self.detection_interpolator = EmpiricalInterpolator(self.detection_probability_points,
+                                                                self.detection_probabilities)
+
+    @property
+    def site_queue(self):
+        """
+        The queue of sites to be surveyed (a SiteQueue). Lists and arrays assigned to site_queue are converted to a
+        SiteQueue.
+        """
+        return self._site_queue
+
+    @site_queue.setter
+    def site_queue(self, site_inds):
+        if not isinstance(site_inds, SiteQueue):
+            site_inds = SiteQueue(site_inds)
+        self._site_queue = site_inds
+
     def check_time(self, time):
         """
         Determines whether or not the detection method is active during the present time step
@@ -74,6 +118,14 @@ class DetectionMethod:
         status = 'field pass'
         # iterate across all operating envelope conditions
         for name, params in self.op_envelope.items():
+            if params['class'] in [1, 3]:
+                # Field wide conditions are read from a timeline evaluated once for every hour of the met data
+                field_pass = self.field_envelope_pass(gas_field, time, name, params)
+                if field_pass is not None:
+                    if not field_pass:
+                        self.op_env_field_fails.append_entry([time.current_time, 1])
+                        return 'field fail'
+                    continue
             # Load a meteorological condition or a site attribute, depending on the class of envelope parameter
             if params['class'] in [1, 2, 3, 4]:
                 if 'interp_mode' in params:
@@ -82,7 +134,7 @@ class DetectionMethod:
                     im = 'mean'
                 condition = gas_field.get_met(time, name, interp_modes=im, ophrs=self.ophrs)[name]
             else:
-                site = gas_field.sites[self.find_site_name(gas_field, site_index)]
+                site = gas_field.sites[self.find_site_name(gas_field, site_index)]['parameters']
                 condition = site.op_env_params[name]
             if params['class'] == 1 and not self.check_min_max_condition(condition, params):
                 status = 'field fail'
@@ -113,6 +165,66 @@ class DetectionMethod:
                 return status
         return status
 
+    def field_envelope_pass(self, gas_field, time, name, params):
+        """
+        Returns the status of a field wide operating envelope condition (class 1 or 3) during the current time step.
+        The condition is evaluated for a time step beginning at every hour of the met data the first time it is
+        checked, and the timeline is reused until the met data, time step, operating hours or condition parameters
+        change.
+
+        :param gas_field: A feast GasField object
+        :param time: A feast Time object
+        :param name: name of the meteorological condition
+        :param params: the operating envelope parameters associated with name
+        :return: True if the condition passes, False if it fails, or None if the condition cannot be read from the
+            timeline (for example, if the condition is drawn at random)
+        """
+        interp_mode = params.get('interp_mode', 'mean').lower()
+        if interp_mode == 'random':
+            return None
+        ophrs = self.ophrs if self.ophrs is not None else {'begin': 0, 'end': 24}
+        met_data = gas_field.met[name]
+        if time.delta_t <= 1/24:
+            # Hourly time steps read the met data directly, so operating hours and interpolation mode do not apply
+            settings = (time.delta_t, self.envelope_params_key(params))
+        else:
+            settings = (time.delta_t, ophrs['begin'], ophrs['end'], interp_mode, self.envelope_params_key(params))
+        cache = self._field_envelope_cache
+        if name not in cache or cache[name][0] is not met_data or cache[name][1] != settings:
+            if time.delta_t <= 1/24:
+                conditions = np.asarray(met_data)
+                valid = np.ones(len(conditions), dtype=bool)
+            else:
+                conditions, n_hours = gas_field.met_window_table(name, interp_mode, time.delta_t, ophrs)
+                # max and min are undefined if there are no met data in the operating hours of a time step
+                valid = (n_hours > 0) | (interp_mode in ['mean', 'median'])
+            if params['class'] == 1:
+                passes = self.check_min_max_conditions(conditions, params)
+            else:
+                passes = ~np.isin(conditions, params['enum_fail_list'])
+            cache[name] = (met_data, settings, passes, valid)
+        passes, valid = cache[name][2:]
+        hour_index = int(np.mod(time.current_time * 24, 8760))
+        if hour_index >= len(passes) or not valid[hour_index]:
+            return None
+        return bool(passes[hour_index])
+
+    @staticmethod
+    def envelope_params_key(params):
+        """
+        Converts operating envelope parameters to a hashable value that can be compared with earlier parameters
+
+        :param params: a dict of operating envelope parameters
+        :return: a tuple
+        """
+        key = []
+        for param_name, value in sorted(params.items()):
+            if isinstance(value, str):
+                key.append((param_name, value))
+            else:
+                key.append((param_name, tuple(np.ravel(value).tolist())))
+        return tuple(key)
+
     def choose_sites(self, gas_field, time, n_sites, clear_sites=True):
         """
         Identifies sites to survey at this time step
@@ -124,6 +236,10 @@ class DetectionMethod:
             Leaving sites in the queue is useful for SiteMonitor type detection methods.
         :return: None
         """
+        if n_sites > 0 and len(self.site_queue) > 0:
+            envelope_status = self.queue_envelope_status(gas_field, time, self.site_queue.to_array())
+            if envelope_status is not None:
+                return self.choose_sites_from_status(time, n_sites, clear_sites, *envelope_status)
         site_inds = []
         queue_ind = 0
         while len(site_inds) < n_sites and queue_ind < len(self.site_queue):
@@ -149,6 +265,130 @@ class DetectionMethod:
                 queue_ind += 1
         return site_inds
 
+    def choose_sites_from_status(self, time, n_sites, clear_sites, status, site_specific):
+        """
+        Selects sites from the queue given the operating envelope status of every site in the queue (see
+        queue_envelope_status). Sites are selected, and operating envelope fails are recorded, exactly as if
+        check_op_envelope were called for one site at a time in queue order.
+
+        :param time: A Time object
+        :param n_sites: Max number of sites to survey at this time step
+        :param clear_sites: If true, clear sites selected from the queue. If False, leave sites in the queue.
+        :param status: array with the status of every site in the queue (0: pass, 1: site fail, 2: field fail)
+        :param site_specific: True if the operating envelope includes site specific conditions
+        :return: a list of site indexes
+        """
+        if not site_specific:
+            # Every site has the same status
+            if status[0] == 2:
+                self.op_env_field_fails.append_entry([time.current_time, 1])
+                return []
+            site_inds = self.site_queue[:n_sites]
+            if clear_sites:
+                del self.site_queue[:n_sites]
+            return site_inds
+        field_fails = np.flatnonzero(status == 2)
+        stop = field_fails[0] if len(field_fails) > 0 else len(status)
+        chosen = np.flatnonzero(status[:stop] == 0)
+        if len(chosen) >= n_sites:
+            chosen = chosen[:n_sites]
+            n_examined, field_fail = chosen[-1] + 1, False
+        else:
+            n_examined, field_fail = stop, stop < len(status)
+        for _ in range(np.count_nonzero(status[:n_examined] == 1)):
+            self.op_env_site_fails.append_entry([time.current_time, 1])
+        if field_fail:
+            self.op_env_field_fails.append_entry([time.current_time, 1])
+        site_inds = self.site_queue.to_array()[chosen].tolist()
+        if clear_sites:
+            self.site_queue.remove_positions(chosen)
+        return site_inds
+
+    def queue_envelope_status(self, gas_field, time, site_inds):
+        """
+        Evaluates the operating envelope for every site in site_inds at once. The status of each site is the status
+        that check_op_envelope would return for that site, but no fails are recorded.
+
+        :param gas_field: A feast GasField object
+        :param time: A feast Time object
+        :param site_inds: indexes of the sites to consider
+        :return: a tuple of two values: an array with the status of every site (0: pass, 1: site fail, 2: field fail)
+            and True if the operating envelope includes site specific conditions. Returns None if the envelope cannot
+            be evaluated for all sites at once (for example, if a condition is drawn at random for every site).
+        """
+        site_inds = np.asarray(site_inds, dtype=int)
+        status = np.zeros(len(site_inds), dtype=int)
+        undecided = np.ones(len(site_inds), dtype=bool)
+        site_specific = False
+        for name, params in self.op_envelope.items():
+            interp_mode = params.get('interp_mode', 'mean')
+            if params['class'] in [1, 2, 3, 4] and interp_mode.lower() == 'random':
+                return None
+            if params['class'] in [1, 3]:
+                field_pass = self.field_envelope_pass(gas_field, time, name, params)
+                if field_pass is None:
+                    return None
+                if not field_pass:
+                    status[undecided] = 2
+                    break
+                continue
+            site_specific = True
+            if params['class'] in [2, 4]:
+                condition = gas_field.get_met(time, name, interp_modes=interp_mode, ophrs=self.ophrs)[name]
+                conditions = np.full(len(site_inds), condition)
+            else:
+                conditions = self.site_attributes(gas_field, name)[site_inds]
+            try:
+                if params['class'] in [2, 6]:
+                    fail = ~self.check_site_min_max_conditions(conditions, np.asarray(params['min'])[site_inds],
+                                                               np.asarray(params['max'])[site_inds])
+                elif params['class'] in [4, 8]:
+                    fail = np.array([conditions[ind] in params['enum_fail_list'][site_ind]
+                                     for ind, site_ind in enumerate(site_inds)], dtype=bool)
+                elif params['class'] == 5:
+                    fail = self.check_min_max_conditions(conditions.astype(float), params)
+                else:
+                    fail = np.array([condition in params['enum_fail_list'] for condition in conditions], dtype=bool)
+            except (IndexError, TypeError, ValueError):
+                # Parameters that cannot be indexed by site as arrays are checked one site at a time
+                return None
+            status[undecided & fail] = 1
+            undecided &= ~fail
+        return status, site_specific
+
+    @staticmethod
+    def site_attributes(gas_field, name):
+        """
+        Returns the value of a site attribute used in operating envelope conditions (site.op_env_params[name]) for
+        every site in a gas field
+
+        :param gas_field: A GasField object
+        :param name: name of the attribute
+        :return: an array of attribute values indexed by site index
+        """
+        type_values = np.empty(len(gas_field.site_type_names), dtype=object)
+        for type_ind, site_name in enumerate(gas_field.site_type_names):
+            type_values[type_ind] = gas_field.sites[site_name]['parameters'].op_env_params[name]
+        return type_values[gas_field.site_type_index]
+
+    @staticmethod
+    def check_site_min_max_conditions(conditions, mins, maxs):
+        """
+        Applies check_min_max_condition to an array of conditions, each with its own min and max values
+
+        :param conditions: array of conditions to check (length N)
+        :param mins: minimum values associated with every condition (array of length N, or NxM to allow M ranges for
+            every condition)
+        :param maxs: maximum values associated with every condition (same shape as mins)
+        :return: boolean array that is True where the condition is allowed
+        """
+        conditions = np.asarray(conditions, dtype=float).reshape(-1, 1)
+        mins = np.asarray(mins, dtype=float).reshape(len(conditions), -1)
+        maxs = np.asarray(maxs, dtype=float).reshape(len(conditions), -1)
+        # check_min_max_condition allows every condition when min is greater than max
+        allowed = (mins > maxs) | ((mins <= conditions) & (conditions <= maxs))
+        return np.any(allowed, axis=1)
+
     @staticmethod
     def check_min_max_condition(condition, params):
         """
@@ -177,6 +417,25 @@ class DetectionMethod:
                     condition_allowed = True
         return condition_allowed
 
+    @staticmethod
+    def check_min_max_conditions(conditions, params):
+        """
+        Applies check_min_max_condition to every condition in an array
+
+        :param conditions: array of conditions to check
+        :param params: a dict with 'min' and 'max' keys. The min and max values can be numbers or array-like.
+        :return: boolean array that is True where the condition is allowed
+        """
+        conditions = np.asarray(conditions)
+        condition_allowed = np.zeros(conditions.shape, dtype=bool)
+        for cond_min, cond_max in zip(np.ravel(params['min']), np.ravel(params['max'])):
+            if cond_min > cond_max:
+                # check_min_max_condition allows every condition when min is greater than max
+                condition_allowed[:] = True
+            else:
+                condition_allowed |= (cond_min <= conditions) & (conditions <= cond_max)
+        return condition_allowed
+
     @staticmethod
     def find_site_name(gas_field, site_index):
         """
@@ -185,10 +444,10 @@ class DetectionMethod:
         :param site_index: an integer indicating the index of the site to be considered
         :return: the key for the site identified by site_index, or -1 if the key cannot be found.
         """
-        for sitename, site in gas_field.sites.items():
-            if site['parameters'].site_inds[0] <= site_index < site['parameters'].site_inds[1]:
-                return sitename
-        return -1
+        type_ind = gas_field.find_site_types([site_index])[0]
+        if type_ind < 0:
+            return -1
+        return gas_field.site_type_names[type_ind]
 
     @staticmethod
     def find_comp_name(gas_field, sitename, comp_index):
@@ -200,10 +459,10 @@ class DetectionMethod:
         :param comp_index: index of the component to consider
         :return: The key for the component identified by comp_index, or -1 if the component is not found.
         """
-        for compname, comp in gas_field.sites[sitename]['parameters'].comp_dict.items():
-            if comp.comp_inds[0] <= comp_index < comp.comp_inds[1]:
-                return compname
-        return -1
+        type_ind = gas_field.find_comp_types(sitename, [comp_index])[0]
+        if type_ind < 0:
+            return -1
+        return gas_field.comp_type_names[sitename][type_ind]
 
     def get_current_conditions(self, time, gas_field, emissions, em_id):
         """
@@ -226,10 +485,72 @@ class DetectionMethod:
             index += 1
         return conditions
 
+    @staticmethod
+    def site_totals(emissions, variable, site_inds):
+        """
+        Sums an emission variable over all emissions at each site
+
+        :param emissions: a DataFrame of current emissions
+        :param variable: name of the emission variable to sum (eg. 'flux')
+        :param site_inds: site indexes to consider
+        :return: an array of the total of variable at each site in site_inds (0 at sites without emissions)
+        """
+        site_inds = np.asarray(site_inds, dtype=int)
+        site_index = np.asarray(emissions['site_index'], dtype=int)
+        n_bins = max(np.max(site_index, initial=-1), np.max(site_inds, initial=-1)) + 1
+        totals = np.bincount(site_index, weights=np.asarray(emissions[variable], dtype=float), minlength=n_bins)
+        return totals[site_inds]
+
+    def get_site_conditions(self, time, gas_field, emissions, site_inds):
+        """
+        Extracts conditions specified in self.detection_variables for whole sites. Emission variables are summed over
+        all emissions at each site in a single pass, and meteorological conditions are read once per call (except in
+        'random' interpolation mode, where a new condition is drawn for every site).
+
+        :param time: a Time object
+        :param gas_field: a GasField object
+        :param emissions: a DataFrame of current emissions
+        :param site_inds: site indexes to consider
+        :return conditions: an array (n_sites, n_variables) of conditions for use in the PoD calculation
+        """
+        conditions = np.zeros([len(site_inds), len(self.detection_variables)])
+        random_met = []
+        index = 0
+        for v, im in self.detection_variables.items():
+            if v in gas_field.met:
+                if im.lower() == 'random':
+                    random_met.append((index, v, im))
+                else:
+                    conditions[:, index] = gas_field.get_met(time, v, interp_modes=im, ophrs=self.ophrs)[v]
+            else:
+                # sum all emission variables needed for detection
+                conditions[:, index] = self.site_totals(emissions, v, site_inds)
+            index += 1
+        # Random conditions are drawn site by site, in the same order as they would be drawn for one site at a time
+        for row in range(len(site_inds)):
+            for index, v, im in random_met:
+                conditions[row, index] = gas_field.get_met(time, v, interp_modes=im, ophrs=self.ophrs)[v]
+        return conditions
+
+    def site_flux_condition(self, gas_field, conditions):
+        """
+        Extracts the total flux at each site from an array of site conditions returned by get_site_conditions
+
+        :param gas_field: a GasField object
+        :param conditions: an array (n_sites, n_variables) of site conditions
+        :return: an array of the total flux at each site, or None if flux is not an emission detection variable
+        """
+        variables = list(self.detection_variables)
+        if ('flux' not in variables) or ('flux' in gas_field.met):
+            return None
+        return conditions[:, variables.index('flux')]
+
     @staticmethod
     def empirical_interpolator(test_conditions, test_results, sim_conditions):
         """
         Calculates the probability of detection by interpolating the value of test_results between test_conditions.
+        Detection methods reuse an EmpiricalInterpolator rather than calling this function, so that the interpolation
+        structures are only built once.
 
         :param test_conditions: conditions to be interpolated from
         :param test_results: results associated with each condition listed in test_conditions
@@ -237,46 +558,54 @@ class DetectionMethod:
             and k is the number of conditions
         :return: an array of the probabilities of detection (dimension N)
         """
-        probs = interp.griddata(test_conditions, test_results, sim_conditions)
-        # griddata returns NaN for vars outside the convex hull of the interpolation data points when using default
-        # linear interpolation. The following code sets those NaN values (outside the convex hull)
-        # to the nearest interpolation point.
-        cond = np.where(np.isnan(probs))[0]
-        probs[cond] = interp.griddata(test_conditions, test_results, sim_conditions[cond], method='nearest')
-        return np.ndarray.flatten(probs)
+        return EmpiricalInterpolator(test_conditions, test_results)(sim_conditions)
 
     def extend_site_queue(self, site_inds):
         """
         Add new sites to the site_queue if they are not already in the queue
 
-        :param site_inds: List of indexes to add to the queue
+        :param site_inds: List of indexes to add to the queue. A range of every site index (range(n_sites), as passed
+            by LDARProgram) is added without converting it to a list.
         :return: None
         """
-        for si in site_inds:
-            if si not in self.site_queue:
-                self.site_queue.append(si)
+        if isinstance(site_inds, range) and site_inds.start == 0 and site_inds.step == 1:
+            self.site_queue.enqueue_all(site_inds.stop)
+        else:
+            self.site_queue.extend_unique(site_inds)
 
-    def flux_val(self, flux):
+    def measured_flux(self, flux, time, site_inds, comp_inds=None, emission_ids=None):
         """
-        Helper function for detection_quantification.
+        Adds measurement noise with standard deviation self.sensitivity to an array of fluxes. Negative measurements
+        are set to 0.
 
-        :param flux: Flux passed to function from emissions DataFrame
-        :return: Original flux if flux is greater than or equal to 0; 0 if flux is less than 0
+        :param flux: array of fluxes to measure (g/s)
+        :param time: a Time object
+        :param site_inds: site index of every flux (used in common random numbers mode)
+        :param comp_inds: component index of every flux (used in common random numbers mode). None for site level
+            measurements.
+        :param emission_ids: emission id of every flux (used in common random numbers mode). None for site level
+            measurements.
+        :return: array of measured fluxes (g/s)
         """
-        dflux = np.random.normal(flux, self.sensitivity)
-        if dflux < 0:
-            return 0
+        if self.crn is None:
+            measured = ecf.random_state(self.rng).normal(flux, self.sensitivity)
         else:
-            return dflux
+            measured = self.crn.normal(self.crn_label, time.time_index, site_inds, comp_inds, loc=flux,
+                                       scale=self.sensitivity, emission_id=emission_ids)
+        return np.maximum(0, measured)
 
-    def detection_quantification(self, emissions, eIDs, time):
+    def detection_quantification(self, emissions, eIDs, time, site_flux=None):
         """
         The detection_quantification method checks the detected emission and evaluates the magnitude of the emission
         measured by the detection technology measurement sensitivity. If the measured emission is greater than the
         user defined dispatch threshold, it is returned in an array.
 
         :param emissions: DataFrame of emissions at current time-step
-        :param eIDs: array of detected emissions DataFrame indices
+        :param eIDs: array of detected emissions DataFrame indices (component level methods) or detected site indexes
+            (site level methods)
+        :param time: a Time object
+        :param site_flux: total flux at each site in eIDs (site level methods only). Site totals are calculated from
+            emissions if site_flux is None.
         :return: array of emissions that meet dispatch criteria
         """
 
@@ -285,24 +614,96 @@ class DetectionMethod:
         if len(eIDs) == 0:
             return eIDs, None
 
-        if ((self.__module__ == 'feast.DetectionModules.site_survey') |
-                (self.__module__ == 'feast.DetectionModules.site_monitor')):
-            em = emissions.loc[(emissions['start_time'] <= time.current_time) &
-                               (emissions['end_time'] > time.current_time)]
-            em = em.loc[
-                em['site_index'].isin(eIDs)].groupby('site_index')['flux'].sum().reset_index()
-            em['detect_val'] = em['flux'].apply(lambda x: self.flux_val(x))
-            thresh_eIDs = em.loc[em['detect_val'] >= self.dispatch_threshold, 'site_index'].values
-            permiss_emiss = em.loc[em['detect_val'] >= self.dispatch_threshold, 'detect_val'].values
-            return thresh_eIDs, permiss_emiss
-        elif self.__module__ == 'feast.DetectionModules.comp_survey':
-            em = emissions.loc[emissions.index.isin(eIDs)].copy()
-            em['detect_val'] = None
-            em['detect_val'] = em['flux'].apply(lambda x: self.flux_val(x))
-            thresh_eIDs = em.loc[((em['detect_val'] >= self.dispatch_threshold) &
-                                  ((em['start_time'] >= time.current_time) &
-                                   (em['end_time'] <= time.current_time)))].index
-            permiss_emiss = em.loc[em['detect_val'] >= self.dispatch_threshold, 'detect_val'].values
-            return thresh_eIDs, permiss_emiss
+        if self.detection_level == 'site':
+            # Sites are measured in order of site index. Detected sites without emissions are not measured.
+            site_inds, detected, _ = np.intersect1d(eIDs, np.asarray(emissions['site_index'], dtype=int),
+                                                    return_indices=True)
+            if site_flux is None:
+                site_flux = self.site_totals(emissions, 'flux', site_inds)
+            else:
+                site_flux = np.asarray(site_flux)[detected]
+            detect_val = self.measured_flux(site_flux, time, site_inds)
+            cond = detect_val >= self.dispatch_threshold
+            return site_inds[cond], detect_val[cond]
+        elif self.detection_level == 'component':
+            em = emissions.loc[emissions.index.isin(eIDs)]
+            if self.crn is None:
+                detect_val = self.measured_flux(em['flux'].to_numpy(), time, None)
+            else:
+                detect_val = self.measured_flux(em['flux'].to_numpy(), time, em['site_index'], em['comp_index'],
+                                                em.index)
+            cond = detect_val >= self.dispatch_threshold
+            # The time filter is kept exactly as it was before vectorization so that results are unchanged. It only
+            # passes emissions with start_time >= current_time >= end_time, so emissions that exist at the current
+            # time are measured but not returned.
+            in_time = (em['start_time'] >= time.current_time) & (em['end_time'] <= time.current_time)
+            return em.index[cond & in_time.to_numpy()], detect_val[cond]
         else:
             raise Exception('this survey type not yet supported')
+
+
+class EmpiricalInterpolator:
+    """
+    Interpolates test results between the test conditions at which they were measured. Conditions inside the convex
+    hull of the test conditions are linearly interpolated and conditions outside the hull are assigned the result of the
+    nearest test condition. The results are identical to scipy.interpolate.griddata followed by a nearest neighbor
+    lookup, but the Delaunay triangulation and nearest neighbor tree are built once, on first use, and reused for
+    every subsequent call. Test results that depend on a single variable are interpolated with np.interp.
+    """
+    def __init__(self, test_conditions, test_results):
+        """
+        :param test_conditions: conditions at which the test results were measured (array of shape N or NxM, where N is
+            the number of conditions and M is the number of variables)
+        :param test_results: results associated with every condition listed in test_conditions (array of shape N)
+        """
+        self.test_conditions = np.asarray(test_conditions)
+        self.test_results = np.asarray(test_results)
+        if self.test_conditions.ndim < 2:
+            self.n_variables = self.test_conditions.ndim
+        else:
+            self.n_variables = self.test_conditions.shape[-1]
+        self._linear, self._nearest = None, None
+        self._points, self._values = None, None
+
+    def __getstate__(self):
+        # The interpolation structures are rebuilt on first use rather than pickled
+        state = self.__dict__.copy()
+        state['_linear'], state['_nearest'] = None, None
+        return state
+
+    def _build(self):
+        if self.n_variables == 1:
+            # Sorted test data for np.interp, sorted the same way as in griddata
+            points = self.test_conditions.ravel()
+            order = np.argsort(points)
+            self._points, self._values = points[order], self.test_results[order]
+            self._nearest = interp.interp1d(self._points, self._values, kind='nearest', axis=0, bounds_error=False,
+                                            fill_value='extrapolate')
+        else:
+            self._linear = interp.LinearNDInterpolator(self.test_conditions, self.test_results)
+            self._nearest = interp.NearestNDInterpolator(self.test_conditions, self.test_results)
+
+    def __call__(self, sim_conditions):
+        """
+        Returns the interpolated results at every condition in sim_conditions
+
+        :param sim_conditions: Nxk array of current conditions, where N is the number of emissions to consider,
+            and k is the number of conditions
+        :return: an array of interpolated results (dimension N)
+        """
+        sim_conditions = np.asarray(sim_conditions)
+        if self.n_variables > 1:
+            sim_conditions = sim_conditions.reshape(-1, self.n_variables)
+        if self._nearest is None:
+            self._build()
+        if self.n_variables == 1:
+            # np.interp holds the end values constant outside of the test conditions, which is equivalent to assigning
+            # the result of the nearest test condition.
+            probs = np.interp(sim_conditions, self._points, self._values)
+        else:
+            probs = self._linear(sim_conditions)
+        # Values outside the convex hull of the test conditions (or NaN conditions) are set to the nearest test result
+        cond = np.where(np.isnan(probs))[0]
+        if len(cond) > 0:
+            probs[cond] = self._nearest(sim_conditions[cond])
+        return np.ndarray.flatten(probs)
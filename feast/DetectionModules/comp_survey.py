@@ -2,7 +2,8 @@
 This module defines the component level survey based detection class, CompSurvey.
 """
 import numpy as np
-from feast.DetectionModules.abstract_detection_method import DetectionMethod
+from feast.EmissionSimModules import emission_class_functions as ecf
+from feast.DetectionModules.abstract_detection_method import DetectionMethod, EmpiricalInterpolator
 
 
 class CompSurvey(DetectionMethod):
@@ -18,6 +19,8 @@ class CompSurvey(DetectionMethod):
     2. A probability of detection surface function to determine which emissions are detected
     3. The ability to call a follow up action
     """
+    detection_level = 'component'
+
     def __init__(self, time, dispatch_object, survey_interval, survey_speed, labor, site_queue,
                  detection_probability_points, detection_probabilities, ophrs,
                  comp_survey_index=0, site_survey_index=0,
@@ -54,6 +57,8 @@ class CompSurvey(DetectionMethod):
         self.site_survey_index = site_survey_index
         self.detection_probability_points = np.array(detection_probability_points)
         self.detection_probabilities = np.array(detection_probabilities)
+        self.detection_interpolator = EmpiricalInterpolator(self.detection_probability_points,
+                                                            self.detection_probabilities)
 
         # -------------- Internal variables -----------------
         self.mid_site_fail_time = np.infty
@@ -76,12 +81,51 @@ class CompSurvey(DetectionMethod):
         n_scores = len(em_surveyed)
         if n_scores == 0:
             return em_surveyed
-        scores = np.random.uniform(0, 1, n_scores)
+        if self.crn is None:
+            scores = ecf.random_state(self.rng).uniform(0, 1, n_scores)
+        else:
+            scores = self.crn.uniform(self.crn_label, time.time_index, emissions.loc[em_surveyed, 'site_index'],
+                                      emissions.loc[em_surveyed, 'comp_index'], emission_id=em_surveyed)
         vals = self.get_current_conditions(time, gas_field, emissions, em_surveyed)
-        probs = self.empirical_interpolator(self.detection_probability_points, self.detection_probabilities, vals)
+        probs = self.detection_interpolator(vals)
         detect = em_surveyed[scores <= probs]
         return detect
 
+    @staticmethod
+    def sort_emitters(emissions):
+        """
+        Sorts emissions by site index and component index so that the emissions on a range of components at a site can
+        be found with a binary search
+
+        :param emissions: a DataFrame of current emissions
+        :return: a tuple of three arrays: the positions of the emissions in the DataFrame in sorted order, and the
+            sorted site indexes and component indexes
+        """
+        site_index = np.asarray(emissions['site_index'])
+        comp_index = np.asarray(emissions['comp_index'])
+        order = np.lexsort((comp_index, site_index))
+        return order, site_index[order], comp_index[order]
+
+    @staticmethod
+    def find_emitters(emissions, sorted_emissions, site_index, comp_start, comp_end):
+        """
+        Finds the emissions at a site with comp_start <= comp_index < comp_end
+
+        :param emissions: a DataFrame of current emissions
+        :param sorted_emissions: the tuple returned by sort_emitters(emissions)
+        :param site_index: index of the site to consider
+        :param comp_start: first component index to consider
+        :param comp_end: upper bound (exclusive) of the component indexes to consider
+        :return: emission_id of the emissions found, in the order in which they appear in emissions
+        """
+        order, sorted_sites, sorted_comps = sorted_emissions
+        site_start = np.searchsorted(sorted_sites, site_index, side='left')
+        site_end = np.searchsorted(sorted_sites, site_index, side='right')
+        site_comps = sorted_comps[site_start:site_end]
+        lo = site_start + np.searchsorted(site_comps, comp_start, side='left')
+        hi = site_start + np.searchsorted(site_comps, comp_end, side='left')
+        return emissions.index[np.sort(order[lo:hi])]
+
     def emitters_surveyed(self, time, gas_field, emissions):
         """
         Determines which emitters are surveyed during the current time step.
@@ -97,6 +141,8 @@ class CompSurvey(DetectionMethod):
         # only considering nonzero leaks is important because cleaning leaks that have been set to 0 from the leak
         # set happens periodically in the simulation and would otherwise cause indexing errors
         emitter_inds = []
+        # emissions sorted by site and component, built when the first site is surveyed
+        sorted_emissions = None
         while remaining_comps > 0:
             if (time.current_time - self.mid_site_fail_time) > self.op_env_wait_time:
                 # if the survey has been stuck part way through a site for op_env_wait_time due to operating envelope
@@ -118,16 +164,14 @@ class CompSurvey(DetectionMethod):
                     if self.mid_site_fail_time > time.current_time:
                         self.mid_site_fail_time = time.current_time
                     break
-            # site_name is used to flag all sites with the same properties
-            # One site name can refer to multiple sites
-            site_name = self.find_site_name(gas_field, self.site_survey_index)
-            site_cond = emissions.site_index == self.site_survey_index
-            comp_cond = (emissions.comp_index >= self.comp_survey_index) & \
-                        (emissions.comp_index < self.comp_survey_index + remaining_comps)
-            emitter_inds.extend(emissions.index[site_cond & comp_cond])
-            if remaining_comps + self.comp_survey_index > gas_field.sites[site_name]['parameters'].max_comp_ind:
-                remaining_comps -= (gas_field.sites[site_name]['parameters'].max_comp_ind - self.comp_survey_index)
-                n_comps = gas_field.sites[site_name]['parameters'].max_comp_ind - self.comp_survey_index
+            max_comp_ind = int(gas_field.site_max_comp_ind[self.site_survey_index])
+            if sorted_emissions is None:
+                sorted_emissions = self.sort_emitters(emissions)
+            emitter_inds.extend(self.find_emitters(emissions, sorted_emissions, self.site_survey_index,
+                                                   self.comp_survey_index, self.comp_survey_index + remaining_comps))
+            if remaining_comps + self.comp_survey_index > max_comp_ind:
+                remaining_comps -= (max_comp_ind - self.comp_survey_index)
+                n_comps = max_comp_ind - self.comp_survey_index
                 self.comp_survey_index = 0
                 self.deployment_cost.append_entry([time.current_time, n_comps / self.survey_speed * self.labor])
             else:
@@ -22,7 +22,11 @@ class LDARProgram:
             must have the form {"name": DetectionMethod}. All of the relationships between detection methods and between
             detection methods and repair methods must be defined by the dispatch_objects specified for each method.
         """
-        self.emissions = copy.deepcopy(gas_field.emissions)
+        if tech_dict:
+            self.emissions = gas_field.emissions.copy()
+        else:
+            # Without detection methods the emissions are never modified, so they can be shared with the gas field
+            self.emissions = gas_field.emissions
         self.emissions_timeseries = []
         self.vents_timeseries = []
         #self.emissions_results = ResultContinuous(units='g/s')
@@ -41,11 +45,15 @@ class LDARProgram:
         :param gas_field: the simulation gas_field object
         :return:
         """
+        # Emissions only change when repairs are made, so every tech is passed the same view of current emissions
+        current_emissions = None
         for i, tech in enumerate(self.tech_dict.values()):
             if hasattr(tech, 'survey_interval') and tech.survey_interval \
                     and np.mod(time.current_time, tech.survey_interval) < time.delta_t:
-                tech.action(list(np.linspace(0, gas_field.n_sites - 1, gas_field.n_sites, dtype=int)))
-            tech.detect(time, gas_field, self.emissions.get_current_emissions(time))
+                tech.action(range(gas_field.n_sites))
+            if current_emissions is None:
+                current_emissions = self.emissions.current_view(time)
+            tech.detect(time, gas_field, current_emissions)
         for rep in self.repair.values():
             rep.repair(time, self.emissions)
 
@@ -57,8 +65,18 @@ class LDARProgram:
         :param time: a FEAST time object
         :return: None
         """
-        for em in self.emissions.emissions.index.unique():
-            empdf_temp = self.emissions.emissions.loc[[em]]
-            max_row = empdf_temp[empdf_temp.end_time == empdf_temp.end_time.max()].iloc[0]
-            if max_row.reparable & (max_row.end_time < time.current_time):
-                self.repair_cost.append_entry([max_row.end_time, max_row.repair_cost])
+        emission_ids = np.asarray(self.emissions.emission_ids)
+        end_time = np.asarray(self.emissions.column('end_time'))
+        rows = np.arange(len(emission_ids))
+        if len(np.unique(emission_ids)) != len(emission_ids):
+            # An emission stored in several rows is represented by its first row with the latest end time. Rows are
+            # sorted by id, then by end time (latest first), then by position, so the first row of every id is used.
+            order = np.lexsort((rows, -end_time, emission_ids))
+            first_in_group = np.concatenate([[True], emission_ids[order][1:] != emission_ids[order][:-1]])
+            # Emissions are listed in the order in which their ids first appear
+            _, first_rows = np.unique(emission_ids, return_index=True)
+            rows = order[first_in_group][np.argsort(first_rows)]
+        cond = np.asarray(self.emissions.column('reparable'), dtype=bool)[rows] & (end_time[rows] < time.current_time)
+        rows = rows[cond]
+        self.repair_cost.extend_entries(
+            np.column_stack([end_time[rows], np.asarray(self.emissions.column('repair_cost'))[rows]]))
@@ -20,10 +20,29 @@ class Repair:
             name = 'repair'
         self.name = name
         self.repair_delay = repair_delay
-        self.to_repair = []
+        # Emission ids awaiting repair, without duplicates, in the order they were passed to action
+        self._pending = {}
         self.repair_count = ResultDiscrete(units='Count')
         self.repair_cost = ResultDiscrete(units='USD')
 
+    def __setstate__(self, state):
+        # Repair objects saved before pending ids were stored in a dict have a to_repair list
+        to_repair = state.pop('to_repair', [])
+        self.__dict__.update(state)
+        if '_pending' not in state:
+            self.to_repair = to_repair
+
+    @property
+    def to_repair(self):
+        """
+        The emission ids awaiting repair (list)
+        """
+        return list(self._pending)
+
+    @to_repair.setter
+    def to_repair(self, emission_ids):
+        self._pending = dict.fromkeys(np.asarray(emission_ids).ravel().tolist())
+
     def repair(self, time, emissions):
         """
         Adjusts the emission end time based on the current time and the repair delay time
@@ -34,24 +53,19 @@ class Repair:
         :return: None
         """
         # todo: Check Null scenario repair costs
-        if len(self.to_repair) > 0:
-            rep_cond = emissions.emissions.reparable & emissions.emissions.index.isin(self.to_repair) & \
-                       (emissions.emissions.end_time > time.current_time + self.repair_delay)
-            emissions.emissions.loc[rep_cond, 'end_time'] = time.current_time + self.repair_delay
-            time_cond = emissions.emissions['start_time'] >= emissions.emissions['end_time']
-            emissions.emissions.loc[time_cond, 'start_time'] = emissions.emissions.loc[time_cond, 'end_time']
-            self.repair_count.append_entry([time.current_time + self.repair_delay,
-                                            len(emissions.emissions.loc[rep_cond].index.unique())])
-            self.repair_cost.append_entry([time.current_time + self.repair_delay,
-                                           np.sum(emissions.emissions.loc[rep_cond, 'repair_cost'])])
-            self.to_repair = []
+        if len(self._pending) > 0:
+            repaired_ids, repair_costs = emissions.end_emissions(np.array(self.to_repair),
+                                                                 time.current_time + self.repair_delay)
+            self.repair_count.append_entry([time.current_time + self.repair_delay, len(np.unique(repaired_ids))])
+            self.repair_cost.append_entry([time.current_time + self.repair_delay, np.sum(repair_costs)])
+            self._pending = {}
 
     def action(self, site_inds=None, emit_inds=None):
         """
         adds emissions to the to_repair queue.
 
         :param site_inds: not used
-        :param emit_inds: A list of emission indexes to repair
+        :param emit_inds: A list of emission indexes to repair. Emissions that are already queued are not added again.
         :return: None
         """
-        self.to_repair.extend(emit_inds)
+        self._pending.update(dict.fromkeys(np.asarray(emit_inds).ravel().tolist()))
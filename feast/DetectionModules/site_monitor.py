@@ -3,7 +3,8 @@ The site_monitor module defines the site monitor detection class, SiteMonitor.
 """
 
 import numpy as np
-from .abstract_detection_method import DetectionMethod
+from feast.EmissionSimModules import emission_class_functions as ecf
+from .abstract_detection_method import DetectionMethod, EmpiricalInterpolator
 
 class SiteMonitor(DetectionMethod):
     """
@@ -15,6 +16,8 @@ class SiteMonitor(DetectionMethod):
     2. A time-to-detect surface specified as a list of conditions and associated mean detection times
     3. The ability to dispatch a follow up action
     """
+    detection_level = 'site'
+
     def __init__(self, time, dispatch_object, time_to_detect_points, time_to_detect_days,
                  ophrs=None, capital=0, site_queue=None, **kwargs):
         """
@@ -46,10 +49,16 @@ class SiteMonitor(DetectionMethod):
         self.time_to_detect_days = time_to_detect_days  # Mean detection times given the conditions listed in _points
 
         # -------------- Internal variables -----------------
-        if type(self.site_queue) is not list:
-            self.site_queue = list(self.site_queue)
         self.time_to_detect_points = np.array(self.time_to_detect_points)
         self.time_to_detect_days = np.array(self.time_to_detect_days)
+        self.time_to_detect_interpolator = EmpiricalInterpolator(self.time_to_detect_points, self.time_to_detect_days)
+
+    def __setstate__(self, state):
+        # SiteMonitor objects saved before interpolators were cached have no time_to_detect_interpolator
+        DetectionMethod.__setstate__(self, state)
+        if 'time_to_detect_interpolator' not in state:
+            self.time_to_detect_interpolator = EmpiricalInterpolator(self.time_to_detect_points,
+                                                                     self.time_to_detect_days)
 
     @staticmethod
     def prob_detection(time, ttd):
@@ -58,15 +67,21 @@ class SiteMonitor(DetectionMethod):
         ttd
 
         :param time: Simulation time object
-        :param ttd: mean time to detection (float--days)
-        :return: the probability of detection during this timestep
+        :param ttd: mean time to detection (float or array--days)
+        :return: the probability of detection during this timestep (float or array, following ttd)
         """
-        if ttd == 0:
-            return 1
-        else:
-            return 1 - np.exp(-time.delta_t / ttd)
+        if np.ndim(ttd) == 0:
+            if ttd == 0:
+                return 1
+            else:
+                return 1 - np.exp(-time.delta_t / ttd)
+        ttd = np.asarray(ttd, dtype=float)
+        probs = np.ones(ttd.shape)
+        cond = ttd != 0
+        probs[cond] = 1 - np.exp(-time.delta_t / ttd[cond])
+        return probs
 
-    def detect_prob_curve(self, time, gas_field, site_inds, emissions):
+    def detect_prob_curve(self, time, gas_field, site_inds, emissions, return_conditions=False):
         """
         Determines which sites are passed to the dispatch method.
         In this case, the sites to pass are determined by calculating a probability of detection based on the
@@ -76,28 +91,25 @@ class SiteMonitor(DetectionMethod):
         :param gas_field: simulation GasField object
         :param site_inds: the set of sites to be considered
         :param emissions: an object storing all emissions in the simulation
+        :param return_conditions: if True, the site conditions of the detected sites are also returned
         :return detect: the indexes of detected leaks
+        :return conditions: site conditions of the detected sites (only returned if return_conditions is True)
         """
         n_scores = len(site_inds)
         if n_scores == 0:
+            if return_conditions:
+                return site_inds, np.zeros([0, len(self.detection_variables)])
             return site_inds
-        probs = np.zeros(n_scores)
-        counter = 0
-        for site_ind in site_inds:
-            vals = np.zeros([1, len(self.detection_variables)])
-            ind = 0
-            for v, im in self.detection_variables.items():
-                if v in gas_field.met:
-                    vals[0, ind] = gas_field.get_met(time, v, interp_modes=im, ophrs=self.ophrs)[v]
-                else:
-                    # sum all emission variables needed for detection
-                    vals[0, ind] = np.sum(emissions[v][emissions.site_index == site_ind])
-                ind += 1
-            ttd = self.empirical_interpolator(self.time_to_detect_points, self.time_to_detect_days, vals)
-            probs[counter] = self.prob_detection(time, ttd)
-            counter += 1
-        scores = np.random.uniform(0, 1, n_scores)
+        vals = self.get_site_conditions(time, gas_field, emissions, site_inds)
+        ttd = self.time_to_detect_interpolator(vals)
+        probs = self.prob_detection(time, ttd)
+        if self.crn is None:
+            scores = ecf.random_state(self.rng).uniform(0, 1, n_scores)
+        else:
+            scores = self.crn.uniform(self.crn_label, time.time_index, site_inds)
         detect = np.array(site_inds)[scores <= probs]
+        if return_conditions:
+            return detect, vals[scores <= probs]
         return detect
 
     def detect(self, time, gas_field, emissions):
@@ -114,8 +126,11 @@ class SiteMonitor(DetectionMethod):
             # choose sites accounts for the operating envelope
             site_inds = self.choose_sites(gas_field, time, len(self.site_queue), clear_sites=False)
             if len(site_inds) > 0:
-                detect = self.detect_prob_curve(time, gas_field, site_inds, emissions)
-                thresh_detect, thresh_emission = self.detection_quantification(emissions, detect, time)
+                detect, conditions = self.detect_prob_curve(time, gas_field, site_inds, emissions,
+                                                            return_conditions=True)
+                site_flux = self.site_flux_condition(gas_field, conditions)
+                thresh_detect, thresh_emission = self.detection_quantification(emissions, detect, time,
+                                                                               site_flux=site_flux)
                 if len(thresh_detect) > 0:
                     self.detection_count.append_entry([time.current_time, len(thresh_detect)])
                 # Deploy follow up action
@@ -0,0 +1,177 @@
+"""
+This module defines SiteQueue, the ordered queue of site indexes used by detection methods.
+"""
+import numpy as np
+
+
+class SiteQueue:
+    """
+    An ordered queue of site indexes. Sites are stored in a buffer with a moving head so that sites can be removed
+    from the front of the queue in O(1), and the number of times each site appears in the queue is stored in an array
+    indexed by site so that membership checks are O(1). Sites can be added one at a time (append), with duplicates
+    skipped (extend_unique) or all at once (enqueue_all).
+
+    SiteQueue supports the list operations used on site queues: len, iteration, 'in', indexing and slicing (slices are
+    returned as lists), del, pop, append, extend and comparison with lists.
+    """
+    def __init__(self, site_inds=None):
+        """
+        :param site_inds: sites to place in the queue, in order (list or array of ints)
+        """
+        self._buffer = np.zeros(16, dtype=int)
+        self._head, self._tail = 0, 0
+        # Number of times each site appears in the queue, indexed by site index
+        self._counts = np.zeros(0, dtype=int)
+        if site_inds is not None:
+            self.extend(site_inds)
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def __iter__(self):
+        return iter(self.to_array().tolist())
+
+    def __contains__(self, site_index):
+        return 0 <= site_index < len(self._counts) and self._counts[site_index] > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_array()[index].tolist()
+        return int(self.to_array()[index])
+
+    def __delitem__(self, index):
+        positions = np.arange(len(self))[index]
+        if isinstance(index, slice) and len(positions) > 0 and positions[0] == 0 and \
+                np.all(np.diff(positions) == 1):
+            # Removing sites from the front of the queue only moves the head
+            self._count(self._buffer[self._head:self._head + len(positions)], -1)
+            self._head += len(positions)
+        else:
+            self.remove_positions(positions)
+
+    def __eq__(self, other):
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self):
+        return "SiteQueue({})".format(list(self))
+
+    def to_array(self):
+        """
+        :return: a read-only array of the sites in the queue, in order
+        """
+        view = self._buffer[self._head:self._tail]
+        view.flags.writeable = False
+        return view
+
+    def _count(self, site_inds, increment):
+        """
+        Updates the number of times that each site in site_inds appears in the queue
+
+        :param site_inds: array of site indexes
+        :param increment: 1 if the sites are added to the queue, -1 if they are removed
+        :return: None
+        """
+        if len(site_inds) == 0:
+            return
+        if np.min(site_inds) < 0:
+            raise ValueError("Site indexes in a SiteQueue must be non-negative integers")
+        n_sites = np.max(site_inds) + 1
+        if n_sites > len(self._counts):
+            self._counts = np.concatenate([self._counts, np.zeros(n_sites - len(self._counts), dtype=int)])
+        np.add.at(self._counts, site_inds, increment)
+
+    def _reserve(self, n_new):
+        """
+        Ensures that n_new sites can be added to the end of the buffer, moving the queue to the front of the buffer or
+        enlarging the buffer if necessary
+
+        :param n_new: number of sites to be added
+        :return: None
+        """
+        n_queued = len(self)
+        if self._tail + n_new <= len(self._buffer):
+            return
+        if n_queued + n_new <= len(self._buffer) // 2:
+            buffer = self._buffer
+        else:
+            buffer = np.zeros(max(2 * len(self._buffer), 2 * (n_queued + n_new)), dtype=int)
+        buffer[:n_queued] = self._buffer[self._head:self._tail]
+        self._buffer, self._head, self._tail = buffer, 0, n_queued
+
+    def append(self, site_index):
+        """
+        Adds a site to the end of the queue
+
+        :param site_index: index of the site (int)
+        :return: None
+        """
+        self.extend([site_index])
+
+    def extend(self, site_inds):
+        """
+        Adds sites to the end of the queue, including sites that are already in the queue
+
+        :param site_inds: list or array of site indexes
+        :return: None
+        """
+        site_inds = np.asarray(site_inds, dtype=int).ravel()
+        self._count(site_inds, 1)
+        self._reserve(len(site_inds))
+        self._buffer[self._tail:self._tail + len(site_inds)] = site_inds
+        self._tail += len(site_inds)
+
+    def extend_unique(self, site_inds):
+        """
+        Adds sites to the end of the queue if they are not already in the queue. If a site appears more than once in
+        site_inds, only the first occurrence is added.
+
+        :param site_inds: list or array of site indexes
+        :return: None
+        """
+        site_inds = np.asarray(site_inds, dtype=int).ravel()
+        if len(site_inds) == 0:
+            return
+        _, first = np.unique(site_inds, return_index=True)
+        site_inds = site_inds[np.sort(first)]
+        queued = site_inds < len(self._counts)
+        queued[queued] = self._counts[site_inds[queued]] > 0
+        self.extend(site_inds[~queued])
+
+    def enqueue_all(self, n_sites):
+        """
+        Adds every site in a gas field (site indexes 0 to n_sites - 1) to the end of the queue if it is not already in
+        the queue
+
+        :param n_sites: number of sites in the gas field
+        :return: None
+        """
+        self.extend_unique(np.arange(n_sites))
+
+    def pop(self, index=-1):
+        """
+        Removes and returns the site at position index in the queue
+
+        :param index: position in the queue (int)
+        :return: the site index
+        """
+        site_index = self[index]
+        del self[index]
+        return site_index
+
+    def remove_positions(self, positions):
+        """
+        Removes the sites at a set of positions in the queue. The order of the remaining sites is unchanged.
+
+        :param positions: array of positions in the queue
+        :return: None
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[positions] = False
+        queue = self._buffer[self._head:self._tail]
+        self._count(queue[~keep], -1)
+        remaining = queue[keep]
+        self._buffer[self._head:self._head + len(remaining)] = remaining
+        self._tail = self._head + len(remaining)
@@ -2,7 +2,8 @@
 The site_survey module defines the site level level survey based detection class, SiteSurvey.
 """
 import numpy as np
-from .abstract_detection_method import DetectionMethod
+from feast.EmissionSimModules import emission_class_functions as ecf
+from .abstract_detection_method import DetectionMethod, EmpiricalInterpolator
 
 
 class SiteSurvey(DetectionMethod):
@@ -17,6 +18,8 @@ class SiteSurvey(DetectionMethod):
     2. A probability of detection surface function to determine which emissions are detected
     3. The ability to dispatch a follow up action
     """
+    detection_level = 'site'
+
     def __init__(self, time, dispatch_object, sites_per_day, site_cost, detection_probability_points,
                  detection_probabilities, op_envelope=None, ophrs=None, site_queue=None,
                  survey_interval=None, **kwargs):
@@ -55,7 +58,8 @@ class SiteSurvey(DetectionMethod):
         self.site_queue = site_queue or []  # queue of sites to survey
         self.detection_probability_points = np.array(detection_probability_points)
         self.detection_probabilities = np.array(detection_probabilities)
-
+        self.detection_interpolator = EmpiricalInterpolator(self.detection_probability_points,
+                                                            self.detection_probabilities)
         # -------------- Set calculated parameters --------------
         work_time = (self.ophrs['end'] - self.ophrs['begin']) / 24
         self.sites_per_timestep = int(self.sites_per_day * (int(time.delta_t) +
@@ -63,7 +67,7 @@ class SiteSurvey(DetectionMethod):
         if self.sites_per_timestep < 1 and self.sites_per_day > 0:
             print("WARNING: expecting less than 1 site surveyed per timestep. May lead to unexpected behavior.")
 
-    def detect_prob_curve(self, time, gas_field, site_inds, emissions):
+    def detect_prob_curve(self, time, gas_field, site_inds, emissions, return_conditions=False):
         """
         This function determines which sites are passed to the dispatch_object by SiteSurvey.  The function sums all
         emissions at a site, determines the probability of detection given the total site emissions and present
@@ -73,31 +77,26 @@ class SiteSurvey(DetectionMethod):
         :param gas_field: Simulation gas_field object
         :param site_inds: The set of sites to be considered
         :param emissions: an object storing all emissions in the simulation
+        :param return_conditions: if True, the site conditions of the detected sites are also returned
 
         :return detect: the indexes of detected leaks
+        :return conditions: site conditions of the detected sites (only returned if return_conditions is True)
         """
 
         n_scores = len(site_inds)
         if n_scores == 0:
+            if return_conditions:
+                return site_inds, np.zeros([0, len(self.detection_variables)])
             return site_inds
-        probs = np.zeros(n_scores)
-        counter = 0
-        for site_ind in site_inds:
-            vals = np.zeros(len(self.detection_variables))
-            ind = 0
-            cond = emissions.index[emissions.site_index == site_ind].to_list()
-            for v, im in self.detection_variables.items():
-                if v in gas_field.met:
-                    vals[ind] = gas_field.get_met(time, v, interp_modes=im, ophrs=self.ophrs)[v]
-                else:
-                    # sum all emission variables needed for detection
-                    vals[ind] = np.sum(emissions[v][cond])
-                ind += 1
-            prob = self.empirical_interpolator(self.detection_probability_points, self.detection_probabilities, vals)
-            probs[counter] = prob
-            counter += 1
-        scores = np.random.uniform(0, 1, n_scores)
+        vals = self.get_site_conditions(time, gas_field, emissions, site_inds)
+        probs = self.detection_interpolator(vals)
+        if self.crn is None:
+            scores = ecf.random_state(self.rng).uniform(0, 1, n_scores)
+        else:
+            scores = self.crn.uniform(self.crn_label, time.time_index, site_inds)
         detect = np.array(site_inds)[scores <= probs]
+        if return_conditions:
+            return detect, vals[scores <= probs]
         return detect
 
     def sites_surveyed(self, gas_field, time):
@@ -129,8 +128,11 @@ class SiteSurvey(DetectionMethod):
         if self.check_time(time):
             site_inds = self.sites_surveyed(gas_field, time)
             if len(site_inds) > 0:
-                detect = self.detect_prob_curve(time, gas_field, site_inds, emissions)
-                thresh_detect, thresh_emission = self.detection_quantification(emissions, detect, time)
+                detect, conditions = self.detect_prob_curve(time, gas_field, site_inds, emissions,
+                                                            return_conditions=True)
+                site_flux = self.site_flux_condition(gas_field, conditions)
+                thresh_detect, thresh_emission = self.detection_quantification(emissions, detect, time,
+                                                                               site_flux=site_flux)
                 if len(thresh_detect) > 0:
                     self.detection_count.append_entry([time.current_time, len(thresh_detect)])
                 # Deploy follow up action
@@ -3,4 +3,5 @@ from . import emission_class_functions
 from . import simulation_classes
 from . import infrastructure_classes
 from . import result_classes
-
+from . import monte_carlo
+from . import common_random_numbers
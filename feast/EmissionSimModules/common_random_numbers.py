@@ -0,0 +1,95 @@
+"""
+common_random_numbers defines a counter-based source of random numbers for comparing LDAR programs with common random
+numbers (CRN).
+"""
+import zlib
+import numpy as np
+
+
+class CommonRandomNumbers:
+    """
+    Generates random numbers from a hash of a seed and a set of identifiers rather than from a sequential stream. The
+    number drawn for a detection method, time step, site and component does not depend on how many numbers were drawn
+    before it, so detection methods that share a label see identical random numbers in every LDAR program that uses
+    them, regardless of the order in which the programs are evaluated. Differences between programs are then driven by
+    the programs themselves rather than by sampling noise.
+    """
+    def __init__(self, seed=0):
+        """
+        :param seed: an integer used to seed the random numbers
+        """
+        self.seed = int(seed)
+
+    @staticmethod
+    def _mix(x):
+        """
+        Applies the splitmix64 finalizer to an array of 64 bit unsigned integers
+
+        :param x: array of np.uint64
+        :return: array of np.uint64
+        """
+        with np.errstate(over='ignore'):
+            x = x + np.uint64(0x9E3779B97F4A7C15)
+            x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            return x ^ (x >> np.uint64(31))
+
+    @staticmethod
+    def label_key(label):
+        """
+        Converts a string label to an integer key that is stable across processes and sessions
+
+        :param label: a string
+        :return: an integer
+        """
+        return zlib.crc32(str(label).encode('utf-8'))
+
+    def uniform(self, label, time_index, site_index, comp_index=None, purpose='detection', emission_id=None):
+        """
+        Returns one random number in [0, 1) for every site (or component, or emission) identified by site_index,
+        comp_index and emission_id
+
+        :param label: name of the detection method drawing the numbers (string)
+        :param time_index: index of the current time step (int)
+        :param site_index: array of site indexes
+        :param comp_index: array of component indexes. If None, the numbers are associated with whole sites.
+        :param purpose: a string distinguishing independent draws made for the same site or component (for example,
+            'detection' or 'noise')
+        :param emission_id: array of emission ids. If set, emissions on the same component receive independent numbers.
+        :return: array of random numbers with the same length as site_index
+        """
+        site_index = np.asarray(site_index, dtype=np.int64).ravel()
+        if comp_index is None:
+            comp_index = np.full(len(site_index), -1, dtype=np.int64)
+        comp_index = np.asarray(comp_index, dtype=np.int64).ravel()
+        key = np.full(len(site_index), self.seed & 0xFFFFFFFFFFFFFFFF, dtype=np.uint64)
+        for ident in [self.label_key(label), self.label_key(purpose), int(time_index)]:
+            key = self._mix(key ^ np.uint64(ident & 0xFFFFFFFFFFFFFFFF))
+        key = self._mix(key ^ site_index.view(np.uint64))
+        key = self._mix(key ^ comp_index.view(np.uint64))
+        if emission_id is not None:
+            key = self._mix(key ^ np.asarray(emission_id, dtype=np.int64).ravel().view(np.uint64))
+        # Use the 53 most significant bits to build a double precision number in [0, 1)
+        return (key >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+    def normal(self, label, time_index, site_index, comp_index=None, purpose='noise', loc=0.0, scale=1.0,
+               emission_id=None):
+        """
+        Returns one normally distributed random number for every site (or component, or emission) identified by
+        site_index, comp_index and emission_id. The numbers are generated with the Box-Muller transform.
+
+        :param label: name of the detection method drawing the numbers (string)
+        :param time_index: index of the current time step (int)
+        :param site_index: array of site indexes
+        :param comp_index: array of component indexes. If None, the numbers are associated with whole sites.
+        :param purpose: a string distinguishing independent draws made for the same site or component
+        :param loc: mean of the distribution (float or array)
+        :param scale: standard deviation of the distribution (float or array)
+        :param emission_id: array of emission ids. If set, emissions on the same component receive independent numbers.
+        :return: array of random numbers with the same length as site_index
+        """
+        u1 = self.uniform(label, time_index, site_index, comp_index, purpose=purpose + ' radius',
+                          emission_id=emission_id)
+        u2 = self.uniform(label, time_index, site_index, comp_index, purpose=purpose + ' angle',
+                          emission_id=emission_id)
+        return loc + scale * np.sqrt(-2 * np.log1p(-u1)) * np.cos(2 * np.pi * u2)
@@ -2,17 +2,523 @@
 A class for storing emission properties and functions for modifying emission proporeties throughout a simulation are
 defined in this module.
 """
+import copy
+import os
 import pickle
 import numpy as np
 import pandas as pd
 
 
+class EmissionStore:
+    """
+    Stores emission properties as a struct of arrays. Every property is held in a preallocated NumPy column that grows
+    geometrically as emissions are appended, and emission ids are mapped to rows through a sorted id index. The store
+    is used by Emission objects created with columnar=True.
+
+    Time window queries are answered with an interval index: rows sorted by start_time, divided into blocks of
+    index_block rows, with the maximum end_time in each block. A query locates the rows that start before the end of
+    the window with a binary search and only inspects blocks that contain an emission ending after the window begins.
+    Block maxima are upper bounds, so they remain valid when end times move earlier (for example, due to repairs).
+    Columns must be modified through set_values so that the index stays consistent.
+
+    Rows are divided into a hot segment and a cold segment. Every compaction_interval days of simulated time,
+    tracked_active_rows moves rows that ended before the current time into the cold segment (see compact). Rows keep
+    their position in the columns, so row indexes and DataFrames built from the store are not affected, but the
+    interval index only covers hot rows. Queries at or after the compaction time only touch hot rows, and queries about
+    earlier times also scan the cold segment.
+
+    A store may share its column arrays with copies made by share. A shared column is copied the first time that the
+    store modifies it, so stores that differ only in a few columns (for example, end_time after repairs) hold a single
+    copy of the other columns.
+    """
+    # Column names and data types, listed in the order used by the emissions DataFrame
+    dtypes = {
+        'flux': np.float64,
+        'site_index': np.int64,
+        'comp_index': np.int64,
+        'reparable': np.bool_,
+        'end_time': np.float64,
+        'repair_cost': np.float64,
+        'start_time': np.float64
+    }
+    # Number of rows summarized by each entry of the interval index
+    index_block = 64
+    # Incremented whenever rows are added, start times change or end times move later (see tracked_active_rows)
+    structure_version = 0
+    # The time and rows returned by the last call to tracked_active_rows
+    _tracked = None
+    # Simulated time between compactions (days)
+    compaction_interval = 30
+    # Cold segment: a flag for every row, the cold rows, and a time before which every cold row ends
+    _cold_mask = None
+    _cold_rows = np.zeros(0, dtype=np.int64)
+    _cold_time = -np.inf
+    # Names of the arrays (columns and 'emission_ids') that are shared with another store and must be copied before
+    # they are modified
+    _shared = frozenset()
+
+    def __init__(self, capacity=0):
+        """
+        :param capacity: Number of rows to preallocate
+        """
+        self.n_rows = 0
+        self.cols = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.emission_ids = np.zeros(capacity, dtype=np.int64)
+        # Incremented whenever the contents of the store change
+        self.version = 0
+        # Sorted id index: rows in order of emission id, and the corresponding sorted ids. Built lazily.
+        self._id_order = None
+        self._sorted_ids = None
+        # Interval index: rows in order of start time, the sorted start times, the position of every row in the sorted
+        # order and the maximum end time in each block of index_block sorted rows. Built lazily.
+        self._start_order = None
+        self._sorted_starts = None
+        self._start_pos = None
+        self._block_max_end = None
+        self.structure_version = 0
+        self._tracked = None
+        self._cold_mask = np.zeros(capacity, dtype=bool)
+        self._cold_rows = np.zeros(0, dtype=np.int64)
+        self._cold_time = -np.inf
+        self._shared = frozenset()
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def capacity(self):
+        return len(self.emission_ids)
+
+    def _reserve(self, n_new):
+        """
+        Grows every column so that at least n_new more rows can be appended without reallocating
+
+        :param n_new: number of rows to be appended
+        :return: None
+        """
+        required = self.n_rows + n_new
+        if required <= self.capacity:
+            return None
+        new_capacity = max(required, 2 * self.capacity, 16)
+        # Every array is reallocated, so none remain shared
+        self._shared = frozenset()
+        for name, col in self.cols.items():
+            grown = np.zeros(new_capacity, dtype=col.dtype)
+            grown[:self.n_rows] = col[:self.n_rows]
+            self.cols[name] = grown
+        grown = np.zeros(new_capacity, dtype=np.int64)
+        grown[:self.n_rows] = self.emission_ids[:self.n_rows]
+        self.emission_ids = grown
+        return None
+
+    def append(self, emission_id, **columns):
+        """
+        Appends new rows to the store
+
+        :param emission_id: array of emission ids for the new rows
+        :param columns: one array per column in EmissionStore.dtypes. Every array must have the same length as
+            emission_id.
+        :return: None
+        """
+        emission_id = np.asarray(emission_id)
+        n_new = len(emission_id)
+        if n_new == 0:
+            return None
+        self._reserve(n_new)
+        self._make_private(*self._shared)
+        for name in self.dtypes:
+            self.cols[name][self.n_rows:self.n_rows + n_new] = columns[name]
+        self.emission_ids[self.n_rows:self.n_rows + n_new] = emission_id
+        self.n_rows += n_new
+        self.changed(ids=True)
+        self._clear_interval_index()
+        return None
+
+    def share(self):
+        """
+        Returns a new EmissionStore holding the same emissions. The two stores share their arrays until one of them
+        modifies a column, which is then copied by the store that modifies it.
+
+        :return: an EmissionStore
+        """
+        other = EmissionStore()
+        other.n_rows = self.n_rows
+        other.cols = dict(self.cols)
+        other.emission_ids = self.emission_ids
+        other._id_order, other._sorted_ids = self._id_order, self._sorted_ids
+        self._shared = other._shared = frozenset(self.cols) | {'emission_ids'}
+        return other
+
+    def _make_private(self, *names):
+        """
+        Copies shared arrays so that they can be modified without affecting other stores
+
+        :param names: column names, or 'emission_ids'
+        :return: None
+        """
+        for name in names:
+            if name not in self._shared:
+                continue
+            if name == 'emission_ids':
+                self.emission_ids = self.emission_ids.copy()
+            else:
+                self.cols[name] = self.cols[name].copy()
+            self._shared = self._shared - {name}
+
+    def changed(self, ids=False):
+        """
+        Records that the contents of the store have been modified
+
+        :param ids: True if emission ids were added or changed
+        :return: None
+        """
+        self.version += 1
+        if ids:
+            self._id_order, self._sorted_ids = None, None
+
+    def column(self, name):
+        """
+        Returns a read-only view of the valid rows of a column
+
+        :param name: column name
+        :return: array of length len(self)
+        """
+        view = self.cols[name][:self.n_rows]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def ids(self):
+        view = self.emission_ids[:self.n_rows]
+        view.flags.writeable = False
+        return view
+
+    def set_values(self, name, rows, values):
+        """
+        Updates the values stored in a column
+
+        :param name: column name
+        :param rows: rows to update
+        :param values: new values (scalar or array with the same length as rows)
+        :return: None
+        """
+        rows = np.arange(self.n_rows)[rows]
+        if len(rows) > 0:
+            self._make_private(name)
+        if name == 'start_time' and np.any(self.cols[name][rows] != values):
+            self._clear_interval_index()
+        elif name == 'end_time' and np.any(self.cols[name][rows] < values):
+            self.structure_version += 1
+        self.cols[name][rows] = values
+        if name == 'end_time' and len(rows) > 0:
+            cold = self.cold_mask()[rows]
+            if np.any(self.cols[name][rows[cold]] >= self._cold_time):
+                # Rows that now end after the compaction time return to the hot segment
+                self._restore_rows(rows[cold])
+            elif self._block_max_end is not None:
+                # Raise the maximum of every block containing a row that now ends later than the block maximum
+                hot_rows = rows[~cold]
+                np.maximum.at(self._block_max_end, self._start_pos[hot_rows] // self.index_block,
+                              self.cols[name][hot_rows])
+        self.changed(ids=False)
+
+    def set_ids(self, emission_ids):
+        """
+        Replaces the emission id of every row
+
+        :param emission_ids: array of emission ids with one entry per row
+        :return: None
+        """
+        self._make_private('emission_ids')
+        self.emission_ids[:self.n_rows] = emission_ids
+        self.changed(ids=True)
+
+    def rows_for_ids(self, emission_ids):
+        """
+        Returns every row associated with the emission ids passed in, sorted by row
+
+        :param emission_ids: array of emission ids
+        :return: array of row indexes
+        """
+        emission_ids = np.asarray(emission_ids, dtype=np.int64).ravel()
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+            self._sorted_ids = self.ids[self._id_order]
+        lo = np.searchsorted(self._sorted_ids, emission_ids, side='left')
+        hi = np.searchsorted(self._sorted_ids, emission_ids, side='right')
+        counts = hi - lo
+        if np.all(counts <= 1):
+            rows = self._id_order[lo[counts == 1]]
+        else:
+            # Expand each [lo, hi) range to accommodate ids that appear in more than one row
+            starts = np.repeat(lo, counts)
+            offsets = np.arange(len(starts)) - np.repeat(np.cumsum(counts) - counts, counts)
+            rows = self._id_order[starts + offsets]
+        return np.unique(rows)
+
+    def _clear_interval_index(self):
+        self._start_order, self._sorted_starts, self._start_pos, self._block_max_end = None, None, None, None
+        self.structure_version += 1
+
+    def cold_mask(self):
+        """
+        :return: a boolean array that is True for every row in the cold segment
+        """
+        if self._cold_mask is None or len(self._cold_mask) < self.n_rows:
+            cold_mask = np.zeros(self.n_rows, dtype=bool)
+            cold_mask[self._cold_rows] = True
+            self._cold_mask = cold_mask
+        return self._cold_mask[:self.n_rows]
+
+    def compact(self, t):
+        """
+        Moves hot rows that end before time t into the cold segment
+
+        :param t: time to consider (days)
+        :return: None
+        """
+        hot = np.flatnonzero(~self.cold_mask())
+        finished = hot[self.cols['end_time'][hot] < t]
+        self._cold_time = max(self._cold_time, t)
+        if len(finished) > 0:
+            self._cold_mask[finished] = True
+            self._cold_rows = np.concatenate([self._cold_rows, finished])
+            self._clear_interval_index()
+
+    def _restore_rows(self, rows):
+        """
+        Moves rows from the cold segment back into the hot segment
+
+        :param rows: array of cold rows
+        :return: None
+        """
+        self._cold_mask[rows] = False
+        self._cold_rows = self._cold_rows[~np.isin(self._cold_rows, rows)]
+        self._clear_interval_index()
+
+    def _cold_rows_where(self, cond_fn):
+        """
+        Returns the cold rows that satisfy a condition
+
+        :param cond_fn: a function that accepts an array of rows and returns a boolean array
+        :return: array of row indexes
+        """
+        return self._cold_rows[cond_fn(self._cold_rows)]
+
+    def _build_interval_index(self):
+        """
+        Sorts hot rows by start time and computes the maximum end time within each block of index_block sorted rows
+
+        :return: None
+        """
+        start_time = self.column('start_time')
+        hot = np.flatnonzero(~self.cold_mask())
+        self._start_order = hot[np.argsort(start_time[hot], kind='stable')]
+        self._sorted_starts = start_time[self._start_order]
+        self._start_pos = np.full(self.n_rows, -1, dtype=np.int64)
+        self._start_pos[self._start_order] = np.arange(len(hot))
+        if len(hot) == 0:
+            self._block_max_end = np.zeros(0)
+            return
+        block_starts = np.arange(0, len(hot), self.index_block)
+        self._block_max_end = np.maximum.reduceat(self.column('end_time')[self._start_order], block_starts)
+
+    def _indexed_rows(self, n_started, t, inclusive):
+        """
+        Returns the rows among the first n_started rows in start time order that end after time t
+
+        :param n_started: number of rows, in order of start time, to consider
+        :param t: time to consider (days)
+        :param inclusive: If True, rows that end exactly at t are included
+        :return: array of row indexes, sorted by row
+        """
+        n_blocks = -(-n_started // self.index_block)
+        block_max = self._block_max_end[:n_blocks]
+        blocks = np.flatnonzero(block_max >= t if inclusive else block_max > t)
+        positions = (blocks[:, np.newaxis] * self.index_block + np.arange(self.index_block)).ravel()
+        rows = self._start_order[positions[positions < n_started]]
+        end_time = self.cols['end_time'][rows]
+        rows = rows[end_time >= t if inclusive else end_time > t]
+        return np.sort(rows)
+
+    def active_rows(self, t):
+        """
+        Returns the rows of all emissions that exist at time t
+
+        :param t: time to consider (days)
+        :return: array of row indexes, sorted by row
+        """
+        if self.n_rows == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self._start_order is None:
+            self._build_interval_index()
+        n_started = np.searchsorted(self._sorted_starts, t, side='right')
+        rows = self._indexed_rows(n_started, t, inclusive=False)
+        if t < self._cold_time:
+            start_time, end_time = self.cols['start_time'], self.cols['end_time']
+            cold = self._cold_rows_where(lambda r: (start_time[r] <= t) & (end_time[r] > t))
+            rows = np.sort(np.concatenate([rows, cold]))
+        return rows
+
+    def tracked_active_rows(self, t):
+        """
+        Returns the same rows as active_rows(t). If t is not earlier than the time of the previous call and no rows
+        have been added, changed start time or moved their end time later since then, the rows are found by updating
+        the rows returned by the previous call: rows that started after the previous time are added and rows that have
+        ended are dropped.
+
+        :param t: time to consider (days)
+        :return: array of row indexes, sorted by row
+        """
+        if t >= self._cold_time + self.compaction_interval:
+            self.compact(t)
+        tracked = self._tracked
+        if tracked is not None and tracked[0] == self.structure_version and tracked[1] <= t and \
+                self._start_order is not None:
+            n_prev = np.searchsorted(self._sorted_starts, tracked[1], side='right')
+            n_started = np.searchsorted(self._sorted_starts, t, side='right')
+            rows = np.concatenate([tracked[2], self._start_order[n_prev:n_started]])
+            rows = np.sort(rows[self.cols['end_time'][rows] > t])
+        else:
+            rows = self.active_rows(t)
+        self._tracked = (self.structure_version, t, rows)
+        return rows
+
+    def rows_in_range(self, t0, t1):
+        """
+        Returns the rows of all emissions that existed at any time between t0 and t1
+
+        :param t0: beginning of interval (days)
+        :param t1: end of interval (days)
+        :return: array of row indexes, sorted by row
+        """
+        if self.n_rows == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self._start_order is None:
+            self._build_interval_index()
+        n_started = np.searchsorted(self._sorted_starts, t1, side='left')
+        rows = self._indexed_rows(n_started, t0, inclusive=True)
+        if t0 < self._cold_time:
+            start_time, end_time = self.cols['start_time'], self.cols['end_time']
+            cold = self._cold_rows_where(lambda r: (start_time[r] < t1) & (end_time[r] >= t0))
+            rows = np.sort(np.concatenate([rows, cold]))
+        return rows
+
+    def to_frame(self, rows=None, read_only=False):
+        """
+        Builds a DataFrame with the same layout as Emission.emissions
+
+        :param rows: rows to include. If None, every row is included.
+        :param read_only: if True, a ReadOnlyFrame is returned. Its columns are copies of the stored data that cannot be
+            written to, so writes through column Series (for example frame.flux.iloc[0] = 0) raise a ValueError.
+        :return: a DataFrame indexed by emission_id
+        """
+        if rows is None:
+            rows = slice(0, self.n_rows)
+        index = pd.Index(self.emission_ids[rows], name='emission_id')
+        if not read_only:
+            return pd.DataFrame({name: self.cols[name][rows] for name in self.dtypes}, index=index)
+        columns = {}
+        for name in self.dtypes:
+            columns[name] = np.array(self.cols[name][rows])
+            columns[name].flags.writeable = False
+        # copy=False keeps every column in its own read-only array instead of consolidating them into writable blocks
+        return ReadOnlyFrame(columns, index=index, copy=False)
+
+    def extend_from_frame(self, frame):
+        """
+        Appends every row of an emissions DataFrame to the store
+
+        :param frame: a DataFrame with the layout of Emission.emissions
+        :return: None
+        """
+        self.append(np.asarray(frame.index), **{name: frame[name].to_numpy() for name in self.dtypes})
+
+    def extend_from_store(self, store):
+        """
+        Appends every row of another EmissionStore
+
+        :param store: an EmissionStore
+        :return: None
+        """
+        self.append(store.ids, **{name: store.column(name) for name in self.dtypes})
+
+
+class _ReadOnlyIndexer:
+    """
+    Wraps a DataFrame indexer (loc, iloc, at or iat) so that values can be read but not assigned
+    """
+    def __init__(self, indexer):
+        self._indexer = indexer
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    def __setitem__(self, key, value):
+        raise TypeError(ReadOnlyFrame.message)
+
+
+class ReadOnlyFrame(pd.DataFrame):
+    """
+    A DataFrame that raises a TypeError if values, its index or its columns are assigned to it. Columnar Emission
+    objects return a ReadOnlyFrame built by EmissionStore.to_frame(read_only=True) from Emission.emissions, because the
+    DataFrame is built from an EmissionStore and changes to it would not be stored. DataFrames derived from a
+    ReadOnlyFrame (for example by copy or selection) are ordinary DataFrames.
+    """
+    message = "DataFrames returned by columnar Emission objects are read-only. Modify emissions with " \
+              "Emission.set_column or Emission.end_emissions."
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def __setitem__(self, key, value):
+        raise TypeError(self.message)
+
+    @property
+    def index(self):
+        return pd.DataFrame.index.__get__(self)
+
+    @index.setter
+    def index(self, value):
+        raise TypeError(self.message)
+
+    @property
+    def columns(self):
+        return pd.DataFrame.columns.__get__(self)
+
+    @columns.setter
+    def columns(self, value):
+        raise TypeError(self.message)
+
+    @property
+    def loc(self):
+        return _ReadOnlyIndexer(super().loc)
+
+    @property
+    def iloc(self):
+        return _ReadOnlyIndexer(super().iloc)
+
+    @property
+    def at(self):
+        return _ReadOnlyIndexer(super().at)
+
+    @property
+    def iat(self):
+        return _ReadOnlyIndexer(super().iat)
+
+
 class Emission:
     """
     Stores all properties of all emissions that exist at a particular instant in a simulation.
+
+    By default, emission properties are stored in a pandas DataFrame (Emission.emissions). If columnar=True, the
+    properties are stored in an EmissionStore instead and Emission.emissions returns a DataFrame built from the store.
+    DataFrames returned by a columnar Emission are read-only (see ReadOnlyFrame): emissions are modified with set_column
+    or end_emissions. Assigning a new DataFrame to Emission.emissions replaces the stored emissions.
     """
     def __init__(self, flux=(), reparable=True, site_index=(), comp_index=(), start_time=0, end_time=np.infty,
-                 repair_cost=(), emission_id=None):
+                 repair_cost=(), emission_id=None, columnar=False):
         """
         :param flux: An array of emission rates (array of floats--gram/second)
         :param reparable: An array of True/False values to indicate whether or not an emission is reparable
@@ -22,6 +528,7 @@ class Emission:
         :param end_time: An array specifying the time when every emission will end (days)
         :param emission_id:
         :param repair_cost: An array storing the cost of repairing every emission ($)
+        :param columnar: If True, store emissions in an array backed EmissionStore rather than a DataFrame
         """
         try:
             length_in = len(flux)
@@ -41,16 +548,137 @@ class Emission:
                 end_time = np.array(end_time)
         except TypeError:
             end_time = np.ones(length_in) * end_time
-        self.emissions = pd.DataFrame({
-            'flux': np.array(flux),
-            'site_index': np.array(site_index),
-            'comp_index': np.array(comp_index),
-            'reparable': rep_array,
-            'end_time': end_time,
-            'repair_cost': np.array(repair_cost),
-            'start_time': np.array(start_time)
-        }, index=np.array(emission_id))
-        self.emissions.index.name = 'emission_id'
+        self._store, self._frame, self._frame_version = None, None, None
+        # The DataFrame returned by current_view and the (time, store version) at which it was built
+        self._view = None
+        if columnar:
+            self._store = EmissionStore(capacity=length_in)
+            self._store.append(np.array(emission_id),
+                               flux=np.array(flux),
+                               site_index=np.array(site_index),
+                               comp_index=np.array(comp_index),
+                               reparable=rep_array,
+                               end_time=end_time,
+                               repair_cost=np.array(repair_cost),
+                               start_time=np.array(start_time))
+        else:
+            self.emissions = pd.DataFrame({
+                'flux': np.array(flux),
+                'site_index': np.array(site_index),
+                'comp_index': np.array(comp_index),
+                'reparable': rep_array,
+                'end_time': end_time,
+                'repair_cost': np.array(repair_cost),
+                'start_time': np.array(start_time)
+            }, index=np.array(emission_id))
+            self.emissions.index.name = 'emission_id'
+
+    def copy(self):
+        """
+        Returns an independent copy of the emissions. If the emissions are stored in an EmissionStore, the copy shares
+        the arrays of the store until either object modifies them (see EmissionStore.share), so copies that are only
+        repaired hold their own end_time (and occasionally start_time) column. DataFrame emissions are copied in full.
+
+        :return: an Emission object
+        """
+        if self._store is None:
+            return copy.deepcopy(self)
+        new_emissions = Emission(columnar=True)
+        new_emissions._store = self._store.share()
+        return new_emissions
+
+    @property
+    def columnar(self):
+        return self._store is not None
+
+    @property
+    def store(self):
+        """
+        The EmissionStore holding emission data, or None if emissions are stored in a DataFrame
+        """
+        return self._store
+
+    @property
+    def emissions(self):
+        """
+        A DataFrame of all emissions. The DataFrame is read-only if emissions are stored in an EmissionStore.
+        """
+        if self._store is None:
+            return self._frame
+        if self._frame_version != self._store.version:
+            self._frame = self._store.to_frame(read_only=True)
+            self._frame_version = self._store.version
+        return self._frame
+
+    @emissions.setter
+    def emissions(self, frame):
+        if self._store is None:
+            self._frame = frame
+        else:
+            self._store = EmissionStore(capacity=len(frame))
+            self._store.extend_from_frame(frame)
+            self._frame, self._frame_version = None, None
+
+    @property
+    def emission_ids(self):
+        """
+        An array of the emission_id associated with every emission
+        """
+        if self._store is not None:
+            return self._store.ids
+        return self.emissions.index.to_numpy()
+
+    def set_emission_ids(self, emission_ids):
+        """
+        Replaces the emission_id associated with every emission
+
+        :param emission_ids: array of new emission ids (one per emission)
+        :return: None
+        """
+        if self._store is not None:
+            self._store.set_ids(emission_ids)
+        else:
+            self.emissions.index = emission_ids
+
+    def column(self, name):
+        """
+        Returns the values of an emission property as an array
+
+        :param name: name of the property (eg. 'flux' or 'end_time')
+        :return: array with one value per emission
+        """
+        if self._store is not None:
+            return self._store.column(name)
+        return self.emissions[name].to_numpy()
+
+    def set_column(self, name, values):
+        """
+        Replaces the values of an emission property
+
+        :param name: name of the property (eg. 'flux' or 'end_time')
+        :param values: new values (scalar or array with one value per emission)
+        :return: None
+        """
+        if self._store is not None:
+            self._store.set_values(name, slice(0, len(self._store)), values)
+        else:
+            self.emissions.loc[:, name] = values
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._store is not None:
+            # The DataFrame can be rebuilt from the store
+            state['_frame'], state['_frame_version'] = None, None
+        state['_view'] = None
+        return state
+
+    def __setstate__(self, state):
+        if 'emissions' in state:
+            # Emission objects saved before the introduction of EmissionStore
+            state['_frame'] = state.pop('emissions')
+            state['_store'], state['_frame_version'] = None, None
+        state.setdefault('_view', None)
+        self.__dict__.update(state)
 
     def get_current_emissions(self, time):
         """
@@ -58,9 +686,30 @@ class Emission:
         :param time: a Time object
         :return: a DataFrame of current emissions
         """
+        if self._store is not None:
+            return self._store.to_frame(self._store.active_rows(time.current_time))
         cond = (self.emissions['start_time'] <= time.current_time) & (self.emissions['end_time'] > time.current_time)
         return self.emissions.loc[cond]
 
+    def current_view(self, time):
+        """
+        Returns all emissions that exist at time.current_time, like get_current_emissions. The DataFrame is built once
+        per time step and returned again by later calls during the same time step, so it may be shared among all
+        detection methods in an LDAR program. If the emissions are stored in an EmissionStore, the set of current
+        emissions is updated incrementally from one time step to the next and the shared DataFrame is read-only (see
+        ReadOnlyFrame).
+
+        :param time: a Time object
+        :return: a DataFrame of current emissions
+        """
+        if self._store is None:
+            return self.get_current_emissions(time)
+        key = (time.current_time, self._store.version)
+        if self._view is None or self._view[0] != key:
+            self._view = (key, self._store.to_frame(self._store.tracked_active_rows(time.current_time),
+                                                    read_only=True))
+        return self._view[1]
+
     def get_emissions_in_range(self, t0, t1, reparable=None):
         """
         Returns all emissions that existed between t0 and t1
@@ -69,6 +718,8 @@ class Emission:
         :param reparable: boolean condition. If set, only returns emissions with a matching reparable property
         :return: a DataFrame of all emissions that existed at any time in the interval t0:t1
         """
+        if self._store is not None:
+            return self._store.to_frame(self._rows_in_range(t0, t1, reparable))
         cond = (self.emissions['start_time'] < t1) & (self.emissions['end_time'] >= t0)
         if reparable is not None:
             cond = cond & (self.emissions['reparable'] == reparable)
@@ -82,6 +733,14 @@ class Emission:
         :param reparable: boolean condition. If set, only returns emissions with a matching reparable property
         :return: Average emission rate between t1 and t0 (g/s)
         """
+        if self._store is not None:
+            rows = self._rows_in_range(t0, t1, reparable)
+            st = self._store.column('start_time')[rows]
+            st[st < t0] = t0
+            et = self._store.column('end_time')[rows]
+            et[et > t1] = t1
+            duration = et - st
+            return np.sum(duration * self._store.column('flux')[rows]) / (t1 - t0)
         em = self.get_emissions_in_range(t0, t1, reparable=reparable)
         st = em['start_time'].to_numpy()
         st[st < t0] = t0
@@ -90,18 +749,186 @@ class Emission:
         duration = et - st
         return np.sum(duration * em.flux) / (t1 - t0)
 
+    def em_rate_timeseries(self, t0s, delta_t):
+        """
+        Computes em_rate_in_range(t0, t0 + delta_t) for all emissions and for non reparable emissions (vents) at every
+        time in t0s. The emissions that exist in each interval are found by sweeping through the start and end times of
+        all emissions once, in order of time, rather than by filtering every emission in every interval. The rates
+        are identical to those returned by em_rate_in_range.
+
+        The rates are computed from the current start and end times. They are equal to rates computed during a
+        simulation as long as no emission has been ended before the end of an interval that was already evaluated, as
+        is the case for Repair objects.
+
+        :param t0s: array of interval start times in increasing order (days)
+        :param delta_t: length of every interval (days)
+        :return: a list of emission rates and a list of vent rates, with one entry per interval (g/s)
+        """
+        start_time, end_time = self.column('start_time'), self.column('end_time')
+        flux, reparable = self.column('flux'), self.column('reparable')
+        start_order = np.argsort(start_time, kind='stable')
+        sorted_starts = start_time[start_order]
+        active = np.zeros(0, dtype=np.int64)
+        n_started = 0
+        emission_rates, vent_rates = [], []
+        for t0 in t0s:
+            t1 = t0 + delta_t
+            # Drop emissions that ended before the interval and add emissions that begin before the end of the interval
+            active = active[end_time[active] >= t0]
+            n_new = np.searchsorted(sorted_starts, t1, side='left')
+            if n_new > n_started:
+                new_rows = start_order[n_started:n_new]
+                active = np.sort(np.concatenate((active, new_rows[end_time[new_rows] >= t0])))
+                n_started = n_new
+            rates = []
+            for rows in [active, active[~reparable[active]]]:
+                st = start_time[rows]
+                st[st < t0] = t0
+                et = end_time[rows]
+                et[et > t1] = t1
+                duration = et - st
+                rates.append(np.sum(duration * flux[rows]) / (t1 - t0))
+            emission_rates.append(rates[0])
+            vent_rates.append(rates[1])
+        return emission_rates, vent_rates
+
     def extend(self, *args):
         """
         Extends the existing emissions data frame with all of the entries in args
         :param args: a list of Emission objects
         :return:
         """
+        if self._store is not None:
+            for a in args:
+                if a.store is not None:
+                    self._store.extend_from_store(a.store)
+                else:
+                    self._store.extend_from_frame(a.emissions)
+            return None
         emission_list = [self.emissions]
         [emission_list.append(a.emissions) for a in args]
         self.emissions = pd.concat(emission_list)
 
+    def end_emissions(self, emission_ids, end_time):
+        """
+        Ends reparable emissions at end_time. Emissions that are not reparable or that would end before end_time
+        without intervention are not modified. The rows of the emissions are found from their ids, so the cost of the
+        update depends on the number of emissions ended rather than the number of emissions stored.
+
+        :param emission_ids: array of emission ids to end
+        :param end_time: the time at which the emissions end (days)
+        :return: the emission_id and repair_cost of every modified emission (arrays)
+        """
+        if self._store is not None:
+            store = self._store
+            rows = store.rows_for_ids(emission_ids)
+            rows = rows[store.column('reparable')[rows] & (store.column('end_time')[rows] > end_time)]
+            store.set_values('end_time', rows, end_time)
+            # Emissions ended before they began start at their end time
+            time_rows = rows[store.column('start_time')[rows] >= end_time]
+            store.set_values('start_time', time_rows, end_time)
+            return store.ids[rows], store.column('repair_cost')[rows]
+        em = self.emissions
+        rows = em.index.get_indexer_for(np.asarray(emission_ids).ravel())
+        rows = np.unique(rows[rows >= 0])
+        rows = rows[em['reparable'].to_numpy()[rows].astype(bool) & (em['end_time'].to_numpy()[rows] > end_time)]
+        em.iloc[rows, em.columns.get_loc('end_time')] = end_time
+        time_rows = rows[em['start_time'].to_numpy()[rows] >= end_time]
+        em.iloc[time_rows, em.columns.get_loc('start_time')] = end_time
+        return em.index[rows].to_numpy(), em['repair_cost'].to_numpy()[rows]
+
+    def _rows_in_range(self, t0, t1, reparable=None):
+        """
+        Returns the store rows of emissions that existed between t0 and t1 (columnar emissions only)
+
+        :param t0: beginning of interval (days)
+        :param t1: end of interval (days)
+        :param reparable: boolean condition. If set, only returns rows with a matching reparable property
+        :return: array of row indexes
+        """
+        rows = self._store.rows_in_range(t0, t1)
+        if reparable is not None:
+            rows = rows[self._store.column('reparable')[rows] == reparable]
+        return rows
+
+
+class EmissionBuilder:
+    """
+    Collects new emissions and adds them to an Emission object in a single call to Emission.extend. Every Emission
+    object passed to extend is assigned the next block of emission ids from a running counter, so the ids are the
+    same as if every object had been added to the Emission object as soon as it was created.
+    """
+    def __init__(self, emissions=None, columnar=False, first_id=None):
+        """
+        :param emissions: the Emission object to extend. If None, a new empty Emission object is created.
+        :param columnar: If True and emissions is None, the new Emission object stores emissions in an EmissionStore
+        :param first_id: id assigned to the first new emission. If None, one more than the largest id in emissions
+            (or 1 if emissions is empty).
+        """
+        self.emissions = Emission(columnar=columnar) if emissions is None else emissions
+        if first_id is None:
+            existing_ids = self.emissions.emission_ids
+            first_id = np.max(existing_ids) + 1 if len(existing_ids) > 0 else 1
+        self.next_id = int(first_id)
+        self._chunks = []
+
+    def __len__(self):
+        # Number of emissions waiting to be added
+        return sum(len(chunk.emission_ids) for chunk in self._chunks)
+
+    def extend(self, *args):
+        """
+        Assigns ids to new emissions and stores them until build is called
+
+        :param args: Emission objects
+        :return: None
+        """
+        for new_emissions in args:
+            n_em = len(new_emissions.emission_ids)
+            new_emissions.set_emission_ids(np.arange(self.next_id, self.next_id + n_em, dtype=int))
+            self.next_id += n_em
+            self._chunks.append(new_emissions)
+
+    def build(self):
+        """
+        Adds every stored emission to the Emission object
+
+        :return: the Emission object
+        """
+        if len(self._chunks) > 0:
+            self.emissions.extend(*self._chunks)
+            self._chunks = []
+        return self.emissions
+
+
+def random_state(rng=None):
+    """
+    Returns the source of random numbers to use in a calculation
+
+    :param rng: a numpy.random.Generator or None
+    :return: rng, or the numpy.random module (the global random state) if rng is None
+    """
+    if rng is None:
+        return np.random
+    return rng
 
-def bootstrap_emission_maker(n_em_in, comp_name, site, time, start_time=None, reparable=True):
+
+def randint(rng, low, high, size=None):
+    """
+    Returns random integers from low (inclusive) to high (exclusive)
+
+    :param rng: a numpy.random.Generator, or the numpy.random module
+    :param low: lowest integer that can be drawn
+    :param high: one above the highest integer that can be drawn
+    :param size: number of integers to draw
+    :return: array of random integers
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng.integers(low, high, size)
+    return rng.randint(low, high, size)
+
+
+def bootstrap_emission_maker(n_em_in, comp_name, site, time, start_time=None, reparable=True, rng=None):
     """
     Create leaks using a bootstrap method.
 
@@ -111,61 +938,76 @@ def bootstrap_emission_maker(n_em_in, comp_name, site, time, start_time=None, re
     :param time: a Time object
     :param start_time: the times at which each emission begins
     :param reparable: Specifies whether emissions should be reparable or not (boolean)
+    :param rng: a numpy.random.Generator. If None, the global numpy random state is used.
     """
+    rng = random_state(rng)
     if start_time is None:
         start_time = np.ones(n_em_in) * time.current_time
     comp = site.comp_dict[comp_name]['parameters']
-    leak_params = comp.emission_params
-    detection_methods = list(leak_params.leak_sizes.keys())
-    flux = []
-    round_err, leaks_per_well, counter = [], [], -1
-    # Calculate leaks per well identified with each detection method stored in leak_params
-    for method in detection_methods:
-        n_leaks = len(leak_params.leak_sizes[method])
-        n_wells = leak_params.well_counts[method]
-        leaks_per_well.append(n_leaks/n_wells)
+    samples = comp.emission_params.bootstrap_samples()
     # Generate the appropriate number of leaks from the distribution associated with each detection method
-    for method in detection_methods:
-        counter += 1
-        n_leaks_key = leaks_per_well[counter] / sum(leaks_per_well) * n_em_in
-        flux.extend(np.random.choice(leak_params.leak_sizes[method], int(n_leaks_key)))
-        round_err.append(n_leaks_key % 1)
+    n_leaks_key = samples['fractions'] * n_em_in
+    n_per_method = n_leaks_key.astype(int)
+    sample_inds = samples['offsets'].repeat(n_per_method) + \
+        randint(rng, 0, samples['counts'].repeat(n_per_method))
     # Add leaks omitted due to inability to add fractional leaks
+    error_intervals = np.cumsum(n_leaks_key % 1)
     # The "round" function in the following line is intended to eliminate floating point errors.
-    chooser = np.random.uniform(0, sum(round_err), round(sum(round_err)))
-    error_intervals = np.cumsum(round_err)
-    for choose in chooser:
-        ind = 0
-        # Add a leak from the appropriate detection method
-        while choose > error_intervals[ind]:
-            ind += 1
-        flux.append(np.random.choice(leak_params.leak_sizes[detection_methods[ind]]))
-    flux = np.array(flux)
-    np.random.shuffle(flux)
-    site_indexes = np.random.randint(site.site_inds[0], site.site_inds[1], len(flux))
-    comp_indexes = comp_indexes_fcn(site, comp_name, len(flux))
+    chooser = rng.uniform(0, error_intervals[-1], round(error_intervals[-1]))
+    # Add a leak from the detection method whose interval contains each chosen number
+    methods = np.minimum(np.searchsorted(error_intervals, chooser, side='left'), len(error_intervals) - 1)
+    sample_inds = np.concatenate([sample_inds, samples['offsets'][methods] +
+                                  randint(rng, 0, samples['counts'][methods])])
+    flux = samples['sizes'][sample_inds]
+    rng.shuffle(flux)
+    site_indexes = randint(rng, site.site_inds[0], site.site_inds[1], len(flux))
+    comp_indexes = comp_indexes_fcn(site, comp_name, len(flux), rng=rng)
     if site.comp_dict[comp_name]['parameters'].null_repair_rate > 0:
         end_times = time.current_time + \
-                    np.random.exponential(1 / site.comp_dict[comp_name]['parameters'].null_repair_rate, len(flux))
+                    rng.exponential(1 / site.comp_dict[comp_name]['parameters'].null_repair_rate, len(flux))
     else:
         end_times = np.inf
-    repair_costs = np.random.choice(comp.repair_cost_dist.repair_costs, len(flux))
+    repair_costs = rng.choice(comp.repair_cost_dist.repair_costs, len(flux))
     return Emission(flux=flux, reparable=reparable, start_time=start_time,
                     site_index=site_indexes, comp_index=comp_indexes, end_time=end_times, repair_cost=repair_costs)
 
 
-def comp_indexes_fcn(site, comp_name, n_inds):
+def comp_indexes_fcn(site, comp_name, n_inds, rng=None):
     """
     Returns an array of indexes to associate with new emissions
 
     :param site: a EmissionSimModules.simulation_classes.Site object
     :param comp_name: name of a component contained in Site.comp_dict
     :param n_inds: Integer of indexes to generate
+    :param rng: a numpy.random.Generator. If None, the global numpy random state is used.
     :return: An array of indexes in the range specified for the relevant component
     """
     low_ind = site.comp_dict[comp_name]['comp_indexes'][0]
     high_ind = site.comp_dict[comp_name]['comp_indexes'][1]
-    return np.random.randint(low_ind, high_ind, n_inds)
+    return randint(random_state(rng), low_ind, high_ind, n_inds)
+
+
+# Data objects loaded by load_data_object, stored by absolute path as (modification time, size, object)
+_data_object_cache = {}
+
+
+def load_data_object(path):
+    """
+    Loads a pickled data object (for example, a LeakData or RepairData object). Each file is read once per process and
+    the same object is returned to every caller until the file is modified, so the object must not be modified by the
+    caller. Worker processes started by fork inherit the objects loaded before they are started.
+
+    :param path: path to a pickled data object
+    :return: the data object
+    """
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    cached = _data_object_cache.get(abs_path)
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        with open(abs_path, 'rb') as f:
+            cached = (stat.st_mtime_ns, stat.st_size, pickle.load(f))
+        _data_object_cache[abs_path] = cached
+    return cached[2]
 
 
 def emission_objects_generator(dist_type, emission_data_path, custom_emission_maker=None):
@@ -175,13 +1017,12 @@ def emission_objects_generator(dist_type, emission_data_path, custom_emission_ma
     :param dist_type: Type of leak distribution to be used
     :param leak_data_path: Path to a leak data file
     """
-    rsc_path = emission_data_path
-    with open(rsc_path, 'rb') as f:
-        emission_params = pickle.load(f)
+    emission_params = load_data_object(emission_data_path)
 
     # Define leak params and emission_size_maker based on the leak distribution type
     if dist_type == 'bootstrap':
         emission_size_maker = bootstrap_emission_maker
+        emission_params.bootstrap_samples()
     elif dist_type.lower() == 'custom':
         if custom_emission_maker is None:
             raise ValueError("custom_emission_maker must be defined for a custom emission distribution type")
@@ -199,7 +1040,7 @@ def emission_objects_generator(dist_type, emission_data_path, custom_emission_ma
     return emission_size_maker, emission_params, em_per_well, em_per_comp
 
 
-def permitted_emission(n_emit, sizes, duration, time, site, comp_name, start_time):
+def permitted_emission(n_emit, sizes, duration, time, site, comp_name, start_time, rng=None):
     """
     Creates an emission object specifying new permitted emissions
 
@@ -210,14 +1051,16 @@ def permitted_emission(n_emit, sizes, duration, time, site, comp_name, start_tim
     :param site: a Site object
     :param comp_name: Name of the component to be considered from within site.comp_dict
     :param start_times: array of times at which emissions start
+    :param rng: a numpy.random.Generator. If None, the global numpy random state is used.
     :return: an Emission object
     """
-    flux = np.random.choice(sizes, n_emit)
-    start_time = np.random.uniform(0, time.end_time, n_emit)
+    rng = random_state(rng)
+    flux = rng.choice(sizes, n_emit)
+    start_time = rng.uniform(0, time.end_time, n_emit)
     reparable = False
     endtime = time.current_time + duration
-    site_indexes = np.random.randint(site.site_inds[0], site.site_inds[1], len(flux))
-    comp_indexes = comp_indexes_fcn(site, comp_name, len(flux))
+    site_indexes = randint(rng, site.site_inds[0], site.site_inds[1], len(flux))
+    comp_indexes = comp_indexes_fcn(site, comp_name, len(flux), rng=rng)
     repair_cost = np.zeros(len(flux))
     return Emission(flux=flux, reparable=reparable, end_time=endtime,
                     site_index=site_indexes, comp_index=comp_indexes, repair_cost=repair_cost, start_time=start_time)
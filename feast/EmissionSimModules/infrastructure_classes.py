@@ -2,9 +2,9 @@
 This module stores component, gasfield and site classes to represent infrastructure in a simulation
 """
 
-import pickle
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import as_strided
 
 from feast.EmissionSimModules import emission_class_functions as ecf
 from feast.EmissionSimModules.emission_class_functions import emission_objects_generator as leak_obj_gen
@@ -59,8 +59,7 @@ class Component:
         self.vent_starts = vent_starts
         # ---- Distribution of leak repair costs
         if self.repair_cost_path:
-            with open(self.repair_cost_path, 'rb') as f:
-                self.repair_cost_dist = pickle.load(f)
+            self.repair_cost_dist = ecf.load_data_object(self.repair_cost_path)
         if self.emission_data_path:
             self.emission_size_maker, self.emission_params, self.emission_per_well, emission_per_comp \
                 = leak_obj_gen(self.dist_type, self.emission_data_path, self.custom_emission_maker)
@@ -81,21 +80,29 @@ class GasField:
     GasField accommodates all data that defines a gas field at the beginning of a simulation.
     """
     def __init__(self, time=None, sites=None, emissions=None,
-                 met_data_path=None):
+                 met_data_path=None, columnar_emissions=False, rng=None):
         """
         :param time: A FEAST time object
         :param sites: a dict of sites like this: {'name': {'number': n_sites, 'parameters': site_object}}
         :param emissions: A FEAST emission object to be used during the simulations
         :param met_data_path: A path to a met data file
+        :param columnar_emissions: If True, emissions created by the GasField are stored in an array backed
+            EmissionStore rather than a DataFrame (see Emission)
+        :param rng: a numpy.random.Generator used for all random numbers drawn by the GasField. If None, the global
+            numpy random state is used.
         """
         self.sites = sites
+        self.rng = rng
         self.met_data_path = met_data_path
+        self.columnar_emissions = columnar_emissions
 
         # -------------- Calculated parameters --------------
         self.n_comps, self.n_sites = 0, 0
         self.comp_dict = {}
         # dict to store met data
         self.met = {}
+        # aggregated met data for every simulation hour, stored by get_met (see met_window_table)
+        self._met_window_cache = {}
 
         # Define indexes and initialize emissions
         self.set_indexes()
@@ -107,6 +114,19 @@ class GasField:
         else:
             self.emissions = emissions
 
+    def __setstate__(self, state):
+        # GasField objects saved before met window tables, lookup tables, rng and columnar emissions were introduced
+        # lack those attributes
+        self.__dict__.update(state)
+        if '_met_window_cache' not in state:
+            self._met_window_cache = {}
+        if 'rng' not in state:
+            self.rng = None
+        if 'columnar_emissions' not in state:
+            self.columnar_emissions = False
+        if 'site_max_comp_ind' not in state or 'comp_type_index' not in state:
+            self.set_lookup_tables()
+
     def initialize_emissions(self, time):
         """
         Create emissions that exist at the beginning of the simulation
@@ -114,7 +134,8 @@ class GasField:
         :param time:
         :return initial_emissions:
         """
-        initial_emissions = ecf.Emission()
+        builder = ecf.EmissionBuilder(columnar=self.columnar_emissions)
+        rng = ecf.random_state(self.rng)
         # This generates new leaks for each component type in each site type
         for sitedict in self.sites.values():
             site = sitedict['parameters']
@@ -122,11 +143,12 @@ class GasField:
                 compobj = site.comp_dict[comp_name]['parameters']
                 n_comp = sitedict['number'] * site.comp_dict[comp_name]['number']
                 if compobj.emission_production_rate > 0:
-                    n_leaks = np.random.binomial(n_comp, compobj.emission_per_comp)
+                    n_leaks = rng.binomial(n_comp, compobj.emission_per_comp)
                 else:
                     n_leaks = 0
-                self.emission_maker(n_leaks, initial_emissions, comp_name, n_comp, time, site)
-        initial_emissions.emissions.loc[:, 'start_time'] = np.zeros(len(initial_emissions.emissions.flux))
+                self.emission_maker(n_leaks, builder, comp_name, n_comp, time, site, rng=self.rng)
+        initial_emissions = builder.build()
+        initial_emissions.set_column('start_time', np.zeros(len(initial_emissions.emission_ids)))
         return initial_emissions
 
     def set_indexes(self):
@@ -140,7 +162,7 @@ class GasField:
             # This ensures that site indexes do not overlap between site types.
             site.site_inds = [site_ind, site_ind + site_dict['number']]
             if site.prod_dat is not None:
-                site.production = np.random.choice(site.prod_dat, site_dict['number'])
+                site.production = ecf.random_state(self.rng).choice(site.prod_dat, site_dict['number'])
             for compname, comp_d in site.comp_dict.items():
                 comp = comp_d['parameters']
                 self.n_comps += comp_d['number'] * site_dict['number']
@@ -149,6 +171,51 @@ class GasField:
                 self.comp_dict[compname] = comp
             site_ind += site_dict['number']
         self.n_sites = site_ind
+        self.set_lookup_tables()
+
+    def set_lookup_tables(self):
+        """
+        Builds the site type and component type lookup tables used by find_site_types and find_comp_types
+        """
+        # Lookup tables: site type (ordinal in site_type_names) and max_comp_ind of every site, and component type
+        # (ordinal in comp_type_names[site type]) of every component index at each site type
+        self.site_type_names = list(self.sites.keys())
+        self.site_type_index = np.zeros(self.n_sites, dtype=int)
+        self.site_max_comp_ind = np.zeros(self.n_sites, dtype=int)
+        self.comp_type_names, self.comp_type_index = {}, {}
+        for type_ind, (site_name, site_dict) in enumerate(self.sites.items()):
+            site = site_dict['parameters']
+            self.site_type_index[site.site_inds[0]:site.site_inds[1]] = type_ind
+            self.site_max_comp_ind[site.site_inds[0]:site.site_inds[1]] = site.max_comp_ind
+            self.comp_type_names[site_name] = list(site.comp_dict.keys())
+            self.comp_type_index[site_name] = np.full(site.max_comp_ind, -1, dtype=int)
+            for comp_ind, comp_d in enumerate(site.comp_dict.values()):
+                self.comp_type_index[site_name][comp_d['comp_indexes'][0]:comp_d['comp_indexes'][1]] = comp_ind
+
+    def find_site_types(self, site_inds):
+        """
+        Returns the site type of every site in site_inds
+
+        :param site_inds: array of site indexes
+        :return: array of site type ordinals (indexes into self.site_type_names), -1 for indexes outside the gas field
+        """
+        site_inds = np.asarray(site_inds, dtype=int)
+        valid = (site_inds >= 0) & (site_inds < self.n_sites)
+        return np.where(valid, self.site_type_index[np.where(valid, site_inds, 0)], -1)
+
+    def find_comp_types(self, site_name, comp_inds):
+        """
+        Returns the component type of every component in comp_inds at a site type
+
+        :param site_name: key of the site type in self.sites
+        :param comp_inds: array of component indexes
+        :return: array of component type ordinals (indexes into self.comp_type_names[site_name]), -1 for indexes that
+            do not belong to a component
+        """
+        comp_inds = np.asarray(comp_inds, dtype=int)
+        table = self.comp_type_index[site_name]
+        valid = (comp_inds >= 0) & (comp_inds < len(table))
+        return np.where(valid, table[np.where(valid, comp_inds, 0)], -1)
 
     def emerging_emissions(self, time):
         """
@@ -156,20 +223,22 @@ class GasField:
         :param time:
         :return:
         """
-        new_emissions = ecf.Emission()
+        existing_ids = self.emissions.emission_ids
+        max_ind = np.max(existing_ids) if len(existing_ids) > 0 else 0
+        builder = ecf.EmissionBuilder(columnar=self.columnar_emissions, first_id=max_ind + 1)
+        rng = ecf.random_state(self.rng)
         for site_dict in self.sites.values():
             site = site_dict['parameters']
             for compname, comp in site.comp_dict.items():
                 if comp['parameters'].vent_duration > 0:
-                    comp['parameters'].vent_starts = np.random.uniform(0, comp['parameters'].vent_period,
-                                                                       comp['number'])
+                    comp['parameters'].vent_starts = rng.uniform(0, comp['parameters'].vent_period, comp['number'])
                 n_comp = site_dict['number'] * comp['number']
-                n_leaks = np.random.poisson(n_comp * comp['parameters'].emission_production_rate * time.end_time)
-                n_episodic = np.random.poisson(n_comp * comp['parameters'].episodic_emission_per_day * time.end_time)
-                self.emission_maker(n_leaks, new_emissions, compname, n_comp, time, site, n_episodic=n_episodic)
-        new_emissions.emissions.end_time += new_emissions.emissions.start_time
-        n_em = len(new_emissions.emissions.flux)
-        new_emissions.emissions.index = np.linspace(1, n_em, n_em, dtype=int) + np.max(self.emissions.emissions.index)
+                n_leaks = rng.poisson(n_comp * comp['parameters'].emission_production_rate * time.end_time)
+                n_episodic = rng.poisson(n_comp * comp['parameters'].episodic_emission_per_day * time.end_time)
+                self.emission_maker(n_leaks, builder, compname, n_comp, time, site, n_episodic=n_episodic,
+                                    rng=self.rng)
+        new_emissions = builder.build()
+        new_emissions.set_column('end_time', new_emissions.column('end_time') + new_emissions.column('start_time'))
         return new_emissions
 
     def emission_size_maker(self, time):
@@ -178,13 +247,14 @@ class GasField:
         :param time: a time object (the parameter delta_t is used)
         :return new_leaks: the new leak object
         """
-        new_leaks = ecf.Emission()
+        new_leaks = ecf.Emission(columnar=self.columnar_emissions)
+        rng = ecf.random_state(self.rng)
         for site_dict in self.sites.values():
             site = site_dict['parameters']
             for compname, comp in site.comp_dict.items():
                 n_comp = site_dict['number'] * comp['number']
-                n_leaks = np.random.poisson(n_comp * comp['parameters'].emission_production_rate * time.delta_t)
-                self.emission_maker(n_leaks, new_leaks, compname, n_comp, time, site)
+                n_leaks = rng.poisson(n_comp * comp['parameters'].emission_production_rate * time.delta_t)
+                self.emission_maker(n_leaks, new_leaks, compname, n_comp, time, site, rng=self.rng)
         return new_leaks
 
     def met_data_maker(self, start_hr=0):
@@ -197,6 +267,7 @@ class GasField:
         if not 0 <= start_hr < 8760:
             raise ValueError("start_hr must satisfy 0 <= start_hr < 8760")
         start_hr = int(start_hr)
+        self._met_window_cache = {}
         sort_order = np.linspace(0, 8759, 8760, dtype=int)
         sort_order = np.mod(sort_order + start_hr, 8760)
         if self.met_data_path:
@@ -237,68 +308,140 @@ class GasField:
             interp_mode = interp_modes[ind]
             if time.delta_t <= 1/24:
                 met_conds[parameter_name] = self.met[parameter_name][hour_index]
-            else:
+            elif interp_mode.lower() == 'random':
                 hr = np.mod(hour_index, 24)
                 start_index = hour_index - hr + int(np.max([hr, ophrs['begin']]))
                 end_index = hour_index - hr + int(np.min([hr + time.delta_t * 24, hour_index + ophrs['end']]))
                 relevant_metdat = self.met[parameter_name][start_index:end_index]
-                if interp_mode.lower() == 'mean':
-                    met_conds[parameter_name] = np.mean(relevant_metdat)
-                elif interp_mode.lower() == 'max':
-                    met_conds[parameter_name] = np.max(relevant_metdat)
-                elif interp_mode.lower() == 'min':
-                    met_conds[parameter_name] = np.min(relevant_metdat)
-                elif interp_mode.lower() == 'median':
-                    met_conds[parameter_name] = np.median(relevant_metdat)
-                elif interp_mode.lower() == 'random':
-                    met_conds[parameter_name] = np.random.choice(relevant_metdat)
-                else:
-                    raise ValueError("Invalid meteorological data type.")
+                met_conds[parameter_name] = ecf.random_state(self.rng).choice(relevant_metdat)
+            else:
+                values, n_hours = self.met_window_table(parameter_name, interp_mode.lower(), time.delta_t, ophrs)
+                if n_hours[hour_index] == 0 and interp_mode.lower() in ['max', 'min']:
+                    raise ValueError("No meteorological data in the operating hours of the current time step.")
+                met_conds[parameter_name] = values[hour_index]
         return met_conds
 
+    def met_window_table(self, parameter_name, interp_mode, delta_t, ophrs):
+        """
+        Returns the met condition aggregated over the operating hours of a time step, for a time step beginning at
+        every hour of the met data. Tables are computed on first use and stored for every distinct combination of
+        parameter, interpolation mode, time step and operating hours. A table is recomputed if the array stored in
+        self.met is replaced, and all tables are cleared by met_data_maker.
+
+        :param parameter_name: name of the meteorological condition (string)
+        :param interp_mode: mean, median, max or min
+        :param delta_t: length of a time step (days)
+        :param ophrs: Hours to consider when aggregating met data of the form {'begin': 5, 'end':17}
+        :return: a tuple of two arrays: the aggregated condition and the number of hours aggregated, each indexed by
+            the hour at which the time step begins
+        """
+        cache = self._met_window_cache
+        key = (parameter_name, interp_mode, delta_t, ophrs['begin'], ophrs['end'])
+        met_data = self.met[parameter_name]
+        if key not in cache or cache[key][0] is not met_data:
+            cache[key] = (met_data, self.met_window_aggregates(met_data, interp_mode, delta_t, ophrs))
+        return cache[key][1]
+
     @staticmethod
-    def emission_maker(n_leaks, new_leaks, comp_name, n_comp, time, site, n_episodic=None):
+    def sliding_windows(data, length):
+        """
+        Returns a read-only view of every window of consecutive values in a 1D array, without copying the data
+
+        :param data: a 1D array
+        :param length: number of values in each window
+        :return: an array view of shape (len(data) - length + 1, length). Row i holds data[i:i + length].
+        """
+        data = np.asarray(data)
+        n_windows = len(data) - length + 1
+        return as_strided(data, shape=(n_windows, length), strides=(data.strides[0], data.strides[0]),
+                          writeable=False)
+
+    @classmethod
+    def met_window_aggregates(cls, met_data, interp_mode, delta_t, ophrs, max_elements=2**20):
+        """
+        Aggregates met data over the operating hours of a time step, for a time step beginning at every hour of the
+        met data. Windows with the same number of hours are aggregated together along the rows of a sliding window
+        view, which gives results identical to aggregating each window separately.
+
+        :param met_data: hourly met data (array)
+        :param interp_mode: mean, median, max or min
+        :param delta_t: length of a time step (days)
+        :param ophrs: Hours to consider when aggregating met data of the form {'begin': 5, 'end':17}
+        :param max_elements: maximum number of elements to copy from the sliding window view at once
+        :return: a tuple of two arrays: the aggregated condition and the number of hours aggregated. The mean and median
+            of zero hours are NaN.
+        """
+        functions = {'mean': np.mean, 'max': np.max, 'min': np.min, 'median': np.median}
+        if interp_mode not in functions:
+            raise ValueError("Invalid meteorological data type.")
+        met_data = np.asarray(met_data)
+        n_data = len(met_data)
+        hour_index = np.arange(n_data)
+        hr = np.mod(hour_index, 24)
+        start_index = hour_index - hr + np.maximum(hr, ophrs['begin']).astype(int)
+        end_index = hour_index - hr + np.minimum(hr + delta_t * 24, hour_index + ophrs['end']).astype(int)
+        # Bounds consistent with slicing met_data[start_index:end_index]
+        start_index = np.minimum(start_index, n_data)
+        n_hours = np.maximum(np.minimum(end_index, n_data) - start_index, 0)
+        if interp_mode in ['max', 'min']:
+            values = np.zeros(n_data, dtype=met_data.dtype)
+        else:
+            values = np.full(n_data, np.nan)
+        for length in np.unique(n_hours[n_hours > 0]):
+            rows = np.flatnonzero(n_hours == length)
+            windows = cls.sliding_windows(met_data, length)
+            step = max(1, max_elements // length)
+            for ind in range(0, len(rows), step):
+                chunk = rows[ind:ind + step]
+                values[chunk] = functions[interp_mode](windows[start_index[chunk]], axis=1)
+        return values, n_hours
+
+    @staticmethod
+    def emission_maker(n_leaks, new_leaks, comp_name, n_comp, time, site, n_episodic=None, rng=None):
         """
         Updates an Emission object with new values returned by emission_size_maker and assigns unique indexes to them
 
         :param n_leaks: number of new leaks to create
-        :param new_leaks: a leak object to extend
+        :param new_leaks: a leak object to extend, or an EmissionBuilder. If an EmissionBuilder is passed, the new
+            emissions are added to it and are not added to an Emission object until EmissionBuilder.build is called.
         :param comp_name: name of a component object included in site.comp_dict
         :param n_comp: the number of components to model
         :param time: a time object
         :param site: a site object
         :param n_episodic: number of episodic emissions to create
-        :param start_time: time at which the new emissions begin emitting
+        :param rng: a numpy.random.Generator. If None, the global numpy random state is used. The generator is only
+            passed to emission makers if it is set, so custom emission makers that do not accept rng can still be used
+            with the global random state.
         :return: None
         """
         comp = site.comp_dict[comp_name]['parameters']
-        max_ind = np.max(new_leaks.emissions.index)
-        if np.isnan(max_ind):
-            max_ind = 0
-        n_existing = len(new_leaks.emissions.index)
+        rng_kwargs = {} if rng is None else {'rng': rng}
+        rng = ecf.random_state(rng)
+        if isinstance(new_leaks, ecf.EmissionBuilder):
+            builder = new_leaks
+        else:
+            builder = ecf.EmissionBuilder(new_leaks)
         if n_leaks > 0:
-            start_time = np.random.uniform(0, time.end_time, n_leaks)
-            new_leaks.extend(comp.emission_size_maker(n_leaks, comp_name, site, time, reparable=comp.base_reparable,
-                                                      start_time=start_time))
+            start_time = rng.uniform(0, time.end_time, n_leaks)
+            builder.extend(comp.emission_size_maker(n_leaks, comp_name, site, time, reparable=comp.base_reparable,
+                                                    start_time=start_time, **rng_kwargs))
         if n_episodic is None:
-            n_episodic = np.random.poisson(n_comp * comp.episodic_emission_per_day * time.delta_t)
+            n_episodic = rng.poisson(n_comp * comp.episodic_emission_per_day * time.delta_t)
 
-        start_time = np.random.uniform(0, time.end_time, n_episodic)
-        new_leaks.extend(comp.intermittent_emission_maker(n_episodic,
-                                                          comp.episodic_emission_sizes,
-                                                          comp.episodic_emission_duration,
-                                                          time, site, comp_name, start_time))
+        start_time = rng.uniform(0, time.end_time, n_episodic)
+        builder.extend(comp.intermittent_emission_maker(n_episodic,
+                                                        comp.episodic_emission_sizes,
+                                                        comp.episodic_emission_duration,
+                                                        time, site, comp_name, start_time, **rng_kwargs))
         n_vent = 0
         if comp.vent_starts.size > 0:
-            n_vent = np.random.poisson(comp.vent_duration / comp.vent_period * n_comp *
-                                       min(1, time.delta_t/comp.vent_period))
-        start_time = np.random.uniform(0, time.end_time, n_vent)
-        new_leaks.extend(comp.intermittent_emission_maker(n_vent, comp.vent_sizes, comp.vent_duration,
-                                                          time, site, comp_name, start_time))
-        n_em = n_vent + n_leaks + n_episodic
-        update_index = np.array(new_leaks.emissions.index)
-        update_index[n_existing:] = np.linspace(max_ind + 1, max_ind + n_em, n_em, dtype=int)
-        new_leaks.emissions.index = update_index
+            n_vent = rng.poisson(comp.vent_duration / comp.vent_period * n_comp *
+                                 min(1, time.delta_t/comp.vent_period))
+        start_time = rng.uniform(0, time.end_time, n_vent)
+        builder.extend(comp.intermittent_emission_maker(n_vent, comp.vent_sizes, comp.vent_duration,
+                                                        time, site, comp_name, start_time, **rng_kwargs))
+        if builder is not new_leaks:
+            builder.build()
         return None
 
 
@@ -0,0 +1,243 @@
+"""
+monte_carlo runs many realizations of a scenario, optionally in parallel, with reproducible random number streams.
+"""
+import contextlib
+import multiprocessing
+import numpy as np
+from scipy import stats
+from ..ResultsProcessing import results_analysis_functions as raf
+from .emission_class_functions import load_data_object
+
+
+def realization_seeds(n_realizations, seed=None, first=0):
+    """
+    Creates one independent SeedSequence for every realization. The seed sequence of a realization depends only on
+    seed and the index of the realization, so a realization generates the same results regardless of how many
+    realizations are run or how they are distributed among processes.
+
+    :param n_realizations: number of realizations
+    :param seed: an integer (or array of integers) used to seed the simulation. If None, fresh entropy is drawn from
+        the operating system.
+    :param first: index of the first realization
+    :return: a list of numpy.random.SeedSequence objects
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    return [np.random.SeedSequence(entropy, spawn_key=(ind,)) for ind in range(first, first + n_realizations)]
+
+
+def run_realization(build_scenario_fn, seed_seq):
+    """
+    Builds and runs a single realization of a scenario.
+
+    The global numpy random state, which is used by FEAST classes that are not passed a generator, is seeded from
+    seed_seq before build_scenario_fn is called. build_scenario_fn also receives a numpy Generator derived from
+    seed_seq for any random numbers it draws itself.
+
+    :param build_scenario_fn: a function that accepts a numpy.random.Generator and returns a Scenario object
+    :param seed_seq: a numpy.random.SeedSequence for the realization
+    :return: the Scenario object after it has been run
+    """
+    global_seq, rng_seq = seed_seq.spawn(2)
+    np.random.seed(global_seq.generate_state(4))
+    scenario = build_scenario_fn(np.random.default_rng(rng_seq))
+    scenario.run(display_status=False, save_method='object')
+    return scenario
+
+
+def _run_realization_args(args):
+    return run_realization(*args)
+
+
+@contextlib.contextmanager
+def _preserved_global_random_state():
+    """
+    Restores the global numpy random state on exit. Realizations run in the calling process reseed the global random
+    state, which would otherwise change the random numbers drawn by the caller afterwards.
+    """
+    state = np.random.get_state()
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
+
+
+def run_monte_carlo(build_scenario_fn, n_realizations, workers=1, seed=None, dir_out='Results', save_method='json',
+                    display_status=True, data_paths=()):
+    """
+    Runs n_realizations realizations of a scenario. Realizations are distributed among a pool of worker processes and
+    saved by the calling process in order of realization, so the results generated for a given seed are identical
+    for any number of workers.
+
+    build_scenario_fn is called once per realization and must return a new Scenario object. When workers > 1,
+    build_scenario_fn must be defined at the top level of a module so that it can be sent to the worker processes,
+    and scripts that call run_monte_carlo should do so under an "if __name__ == '__main__':" guard.
+
+    :param build_scenario_fn: a function that accepts a numpy.random.Generator and returns a Scenario object
+    :param n_realizations: number of realizations to run
+    :param workers: number of worker processes. If 1, realizations are run in the calling process.
+    :param seed: an integer used to seed the simulation. If None, results are not reproducible.
+    :param dir_out: path to a directory in which to save results (string)
+    :param save_method: method passed to Scenario.save. If 'object', no results are saved and the Scenario objects are
+        returned.
+    :param display_status: if True, print a message as each realization is completed
+    :param data_paths: paths of data files used by build_scenario_fn (see emission_class_functions.load_data_object).
+        The files are loaded before worker processes are started, so that workers started by fork share them.
+    :return: a list of Scenario objects if save_method is 'object', otherwise None
+    """
+    for path in data_paths:
+        load_data_object(path)
+    tasks = [(build_scenario_fn, seed_seq) for seed_seq in realization_seeds(n_realizations, seed)]
+    if workers > 1:
+        with multiprocessing.Pool(processes=workers) as pool:
+            return _collect_realizations(pool.imap(_run_realization_args, tasks), n_realizations, dir_out, save_method,
+                                         display_status)
+    with _preserved_global_random_state():
+        return _collect_realizations(map(_run_realization_args, tasks), n_realizations, dir_out, save_method,
+                                     display_status)
+
+
+def _collect_realizations(scenarios, n_realizations, dir_out, save_method, display_status):
+    """
+    Saves or collects completed realizations in order of realization
+
+    :param scenarios: an iterable of Scenario objects that have been run
+    :return: a list of Scenario objects if save_method is 'object', otherwise None
+    """
+    out = []
+    for ind, scenario in enumerate(scenarios):
+        if save_method == 'object':
+            out.append(scenario)
+        else:
+            scenario.save(dir_out, method=save_method)
+        if display_status:
+            print("Completed realization {:0.0f} of {:0.0f}".format(ind + 1, n_realizations))
+    if save_method == 'object':
+        return out
+    return None
+
+
+class RunningStatistics:
+    """
+    Tracks the mean and variance of an array of quantities as samples are added one at a time (Welford's algorithm)
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, sample):
+        """
+        Adds a sample
+
+        :param sample: array of values with the same shape as every other sample
+        :return: None
+        """
+        sample = np.array(sample, dtype=float)
+        if self.n == 0:
+            self.mean = np.zeros(sample.shape)
+            self.m2 = np.zeros(sample.shape)
+        self.n += 1
+        delta = sample - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (sample - self.mean)
+
+    @property
+    def variance(self):
+        """
+        The sample variance of every quantity (infinite until two samples have been added)
+        """
+        if self.n < 2:
+            return np.full(np.shape(self.mean), np.inf)
+        return self.m2 / (self.n - 1)
+
+    def ci_width(self, confidence=0.95):
+        """
+        Returns the width of the Student t confidence interval for the mean of every quantity
+
+        :param confidence: confidence level of the interval (between 0 and 1)
+        :return: array of confidence interval widths
+        """
+        if self.n < 2:
+            return np.full(np.shape(self.mean), np.inf)
+        return 2 * stats.t.ppf(0.5 + confidence / 2, self.n - 1) * np.sqrt(self.variance / self.n)
+
+
+def run_adaptive_monte_carlo(build_scenario_fn, discount_rate, gas_price, npv_tolerance, emissions_tolerance=None,
+                             batch_size=10, max_realizations=1000, confidence=0.95, workers=1, seed=None,
+                             dir_out=None, save_method='json', display_status=True, data_paths=()):
+    """
+    Runs realizations of a scenario in batches until the mean null NPV ('Total') of every LDAR program, and optionally
+    the mean time integrated emissions of every LDAR program, are known to within a tolerance, or until
+    max_realizations realizations have been run. Realization i uses the same random numbers as realization i of
+    run_monte_carlo with the same seed.
+
+    :param build_scenario_fn: a function that accepts a numpy.random.Generator and returns a Scenario object
+    :param discount_rate: The discount rate of future cash flows (should be between 0 and 1)
+    :param gas_price: The value to assign to mitigated gas losses ($/gram)
+    :param npv_tolerance: maximum width of the confidence interval of the mean null NPV of every LDAR program ($)
+    :param emissions_tolerance: maximum width of the confidence interval of the mean time integrated emissions of
+        every LDAR program (grams). If None, emissions are not used to decide when to stop.
+    :param batch_size: number of realizations to run between convergence checks
+    :param max_realizations: maximum number of realizations to run
+    :param confidence: confidence level of the intervals (between 0 and 1)
+    :param workers: number of worker processes. If 1, realizations are run in the calling process.
+    :param seed: an integer used to seed the simulation. If None, results are not reproducible.
+    :param dir_out: path to a directory in which to save every realization. If None, realizations are not saved.
+    :param save_method: method passed to Scenario.save if dir_out is set
+    :param display_status: if True, print the confidence interval widths after every batch
+    :param data_paths: paths of data files used by build_scenario_fn, loaded before worker processes are started
+    :return: a dict with the following keys:
+        'n_realizations'    number of realizations run
+        'converged'         True if the tolerances were met
+        'programs'          names of the LDAR programs other than 'Null' (order of the null NPV arrays)
+        'npv_mean'          mean null NPV of each LDAR program ($)
+        'npv_ci_width'      width of the confidence interval of npv_mean ($)
+        'emission_programs' names of all LDAR programs (order of the emissions arrays)
+        'emissions_mean'    mean time integrated emissions of each LDAR program (grams)
+        'emissions_ci_width'    width of the confidence interval of emissions_mean (grams)
+    """
+    for path in data_paths:
+        load_data_object(path)
+    entropy = np.random.SeedSequence(seed).entropy
+    npv_stats, emission_stats = RunningStatistics(), RunningStatistics()
+    programs, emission_programs, converged = None, None, False
+    if workers > 1:
+        pool_context = multiprocessing.Pool(processes=workers)
+    else:
+        # Realizations run in this process, which must not change the caller's global random state
+        pool_context = _preserved_global_random_state()
+    with pool_context as pool:
+        while npv_stats.n < max_realizations and not converged:
+            n_batch = min(batch_size, max_realizations - npv_stats.n)
+            tasks = [(build_scenario_fn, seed_seq) for seed_seq in realization_seeds(n_batch, entropy, npv_stats.n)]
+            if pool is None:
+                scenarios = map(_run_realization_args, tasks)
+            else:
+                scenarios = pool.imap(_run_realization_args, tasks)
+            for scenario in scenarios:
+                npv = raf.scenario_npv(scenario, discount_rate, gas_price)
+                npv_stats.update(npv['Total'])
+                seconds_per_step = scenario.time.delta_t * 24 * 3600
+                emission_stats.update([np.sum(lp.emissions_timeseries) * seconds_per_step
+                                       for lp in scenario.ldar_program_dict.values()])
+                if programs is None:
+                    programs = [name for name in scenario.ldar_program_dict if name != 'Null']
+                    emission_programs = list(scenario.ldar_program_dict.keys())
+                if dir_out is not None:
+                    scenario.save(dir_out, method=save_method)
+            converged = np.all(npv_stats.ci_width(confidence) <= npv_tolerance)
+            if emissions_tolerance is not None:
+                converged = converged and np.all(emission_stats.ci_width(confidence) <= emissions_tolerance)
+            if display_status:
+                print("Completed {:0.0f} realizations. Largest NPV confidence interval: {:0.4g}".format(
+                    npv_stats.n, np.max(npv_stats.ci_width(confidence), initial=0)))
+    return {
+        'n_realizations': npv_stats.n,
+        'converged': bool(converged),
+        'programs': programs,
+        'npv_mean': npv_stats.mean,
+        'npv_ci_width': npv_stats.ci_width(confidence),
+        'emission_programs': emission_programs,
+        'emissions_mean': emission_stats.mean,
+        'emissions_ci_width': emission_stats.ci_width(confidence)
+    }
@@ -38,6 +38,19 @@ class ResultAggregate:
         self.time_value.append(time_value)
         return None
 
+    def extend_entries(self, time_values):
+        """
+        Add several entries to the ResultAggregate object
+
+        :param time_values: a list of ordered pairs following this pattern: [time, value], or an array with one row per
+            pair
+        :return: None
+        """
+        if isinstance(time_values, np.ndarray):
+            time_values = time_values.tolist()
+        self.time_value.extend(time_values)
+        return None
+
 
 class ResultDiscrete(ResultAggregate):
     """
@@ -4,6 +4,8 @@
 import os
 import pickle
 from ..DetectionModules.ldar_program import LDARProgram
+from ..DetectionModules.abstract_detection_method import DetectionMethod
+from .common_random_numbers import CommonRandomNumbers
 import json
 import pandas as pd
 
@@ -29,15 +31,73 @@ class Scenario:
     """
     A class to store all data specifying a scenario and the methods to run and save a realization
     """
-    def __init__(self, time, gas_field, ldar_program_dict):
+    def __init__(self, time, gas_field, ldar_program_dict, rng=None, crn_seed=None):
         """
         :param time: Time object
         :param gas_field: GasField object
         :param ldar_program_dict: dict of detection methods and associated data
+        :param rng: a numpy.random.Generator. If set, the generator is assigned to the gas field and to every detection
+            method in the LDAR programs (including detection methods reached through dispatch objects) that does not
+            already have its own generator.
+        :param crn_seed: an integer. If set, detection methods draw detection scores and measurement noise from
+            common random numbers keyed on this seed, the name of the detection method, the time step, the site and
+            the component (see set_common_random_numbers).
         """
         self.time = time
         self.gas_field = gas_field
         self.ldar_program_dict = ldar_program_dict
+        self.rng = rng
+        self.crn_seed = crn_seed
+        if rng is not None:
+            self.set_rng(rng)
+        if crn_seed is not None:
+            self.set_common_random_numbers(crn_seed)
+
+    def set_rng(self, rng):
+        """
+        Assigns a random number generator to the gas field and to every detection method that does not have one
+
+        :param rng: a numpy.random.Generator
+        :return: None
+        """
+        if self.gas_field.rng is None:
+            self.gas_field.rng = rng
+        for lp in self.ldar_program_dict.values():
+            for tech in lp.tech_dict.values():
+                # follow the chain of dispatch objects, which may include additional detection methods
+                visited = []
+                while isinstance(tech, DetectionMethod) and tech not in visited:
+                    visited.append(tech)
+                    if tech.rng is None:
+                        tech.rng = rng
+                    tech = getattr(tech, 'dispatch_object', None)
+
+    def set_common_random_numbers(self, crn_seed):
+        """
+        Enables common random numbers (CRN) for every detection method in the LDAR programs. Each detection method is
+        labeled with its key in the tech_dict of its LDAR program (detection methods that are only reachable through a
+        dispatch object are labeled with the label of the dispatching method followed by ' dispatch'). Detection methods
+        with the same label in different LDAR programs draw identical random numbers for the same site, component and
+        time step, so comparisons between LDAR programs are not affected by the order in which programs draw random
+        numbers.
+
+        :param crn_seed: an integer used to seed the common random numbers
+        :return: None
+        """
+        crn = CommonRandomNumbers(crn_seed)
+        for lp in self.ldar_program_dict.values():
+            for tech_name, tech in lp.tech_dict.items():
+                if isinstance(tech, DetectionMethod):
+                    tech.crn, tech.crn_label = crn, tech_name
+        for lp in self.ldar_program_dict.values():
+            for tech in lp.tech_dict.values():
+                visited = []
+                while isinstance(tech, DetectionMethod) and tech not in visited:
+                    visited.append(tech)
+                    dispatch = getattr(tech, 'dispatch_object', None)
+                    if isinstance(dispatch, DetectionMethod) and dispatch.crn is None:
+                        dispatch.crn, dispatch.crn_label = crn, tech.crn_label + ' dispatch'
+                    tech = dispatch
 
     def run(self, dir_out="Results", display_status=True, save_method='json'):
         """
@@ -53,19 +113,27 @@ class Scenario:
             self.ldar_program_dict['Null'] = LDARProgram(self.gas_field, tech_dict={})
         # -------------- Run the simulation --------------
         # check_timestep(gas_field, time)
+        t0s = []
         for self.time.time_index in range(0, self.time.n_timesteps):
             if display_status and self.time.current_time % (self.time.end_time / 10) < self.time.delta_t:
                 print("The evaluation is {:0.0f}% complete".format(100 * self.time.time_index / self.time.n_timesteps))
             # Loop through each LDAR program:
             for lp in self.ldar_program_dict.values():
+                if not lp.tech_dict:
+                    # Programs without detection methods never modify emissions
+                    continue
                 lp.action(self.time, self.gas_field)
-                t0 = self.time.current_time
-                lp.emissions_timeseries.append(lp.emissions.em_rate_in_range(t0, t0 + self.time.delta_t))
-                lp.vents_timeseries.append(lp.emissions.em_rate_in_range(t0, t0 + self.time.delta_t, reparable=False))
                 #todo populate emissions and vent timeseries as a result continuous class
                 #lp.emissions_results.append([t0, lp.emissions.em_rate_in_range(t0, t0 + self.time.delta_t)])
                 #lp.vents_results.append([t0, lp.emissions.em_rate_in_range(t0, t0 + self.time.delta_t, reparable=False)])
+            t0s.append(self.time.current_time)
             self.time.current_time += self.time.delta_t
+        # Repairs only end emissions after the time step in which they occur, so the emission rate in every time step
+        # can be computed from the final emission end times.
+        for lp in self.ldar_program_dict.values():
+            emissions_timeseries, vents_timeseries = lp.emissions.em_rate_timeseries(t0s, self.time.delta_t)
+            lp.emissions_timeseries.extend(emissions_timeseries)
+            lp.vents_timeseries.extend(vents_timeseries)
         [lp.calc_rep_costs(self.time) for lp in self.ldar_program_dict.values()]
 
         # -------------- Save results --------------
@@ -151,6 +151,19 @@ def npv_calculator(filepath, discount_rate, gas_price):
             null_npv          NPV of each LDAR program compared to a scenario with only the Null LDAR program [k$/well]
     """
     sample = load(open(filepath, 'rb'))
+    return scenario_npv(sample, discount_rate, gas_price)
+
+
+def scenario_npv(sample, discount_rate, gas_price):
+    """
+        Calculates the net present value (NPV) of each LDAR program in a Scenario object that has been run
+
+        :param sample:        a Scenario object
+        :param discount_rate: The discount rate of future cash flows (should be between 0 and 1)
+        :param gas_price: The value to assign to mitigated gas losses ($/gram)
+        :return:
+            null_npv          NPV of each LDAR program compared to a scenario with only the Null LDAR program [k$/well]
+    """
     # The 'Null' LDAR program is special here because null_npv is calculated with respect to it
     if 'Null' not in sample.ldar_program_dict:
         raise NameError('tech_dict must contain a "Null" detection method to use npv_calculator')
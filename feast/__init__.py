@@ -3,3 +3,4 @@ from . import EmissionSimModules
 from . import DetectionModules
 from . import input_data_classes
 from . import ResultsProcessing
+from .EmissionSimModules.monte_carlo import run_monte_carlo, run_adaptive_monte_carlo
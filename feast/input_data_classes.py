@@ -1,6 +1,7 @@
 """
 This module defines all classes used to store input data.
 """
+import numpy as np
 
 
 class DataFile:
@@ -37,6 +38,39 @@ class LeakData(DataFile):
         self.leak_sizes = leak_sizes or dict()
         self.well_counts = dict()
         self.comp_counts = dict()
+        self._bootstrap_samples = None
+
+    def bootstrap_samples(self):
+        """
+        Returns the data used to draw leak sizes in bootstrap_emission_maker. The data are computed on the first call and
+        recomputed if a detection method is added or its leak sizes or well count change.
+
+        :return: a dict with the following keys:
+            'methods'   list of detection methods
+            'fractions' fraction of leaks associated with each detection method (leaks per well found by the method
+                        divided by the total leaks per well found by all methods)
+            'sizes'     leak sizes found by every detection method, concatenated in the order of methods
+            'offsets'   index of the first leak size of each detection method in sizes
+            'counts'    number of leak sizes found by each detection method
+        """
+        # The samples are keyed by the contents of the leak sizes, so that lists changed in place are detected
+        key = tuple((method, np.asarray(sizes, dtype=float).tobytes(), self.well_counts[method])
+                    for method, sizes in self.leak_sizes.items())
+        # LeakData objects saved before bootstrap samples were cached do not have _bootstrap_samples
+        cached = getattr(self, '_bootstrap_samples', None)
+        if cached is None or cached[0] != key:
+            methods = list(self.leak_sizes.keys())
+            leaks_per_well = [len(self.leak_sizes[method]) / self.well_counts[method] for method in methods]
+            counts = np.array([len(self.leak_sizes[method]) for method in methods], dtype=int)
+            samples = {
+                'methods': methods,
+                'fractions': np.array([lpw / sum(leaks_per_well) for lpw in leaks_per_well]),
+                'sizes': np.concatenate([np.asarray(self.leak_sizes[method]) for method in methods]),
+                'offsets': np.cumsum(counts) - counts,
+                'counts': counts
+            }
+            self._bootstrap_samples = (key, samples)
+        return self._bootstrap_samples[1]
 
     def define_data(self, leak_data=None, well_counts=None, comp_counts=None, detect_methods=None):
         """